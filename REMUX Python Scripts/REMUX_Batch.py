@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+REMUX_Batch.py
+Headless batch runner for cron jobs and ingest pipelines: no prompts, no live table.
+Batches come from command-line flags or a JSON/TOML job spec holding any number of them; they
+run one after another through remux_engine, progress is written to stdout as JSON lines and the
+exit code tells how the run went (see EXIT_*). Human-readable messages go to stderr.
+With --watch a single batch runs as a daemon: files are remuxed as they arrive in the input
+folder (see remux_watch) until the process is stopped.
+
+Job spec (TOML shown; JSON takes the same keys). Top-level keys are defaults for every batch:
+
+    audio = "eng"
+    jobs = 4
+
+    [[batch]]
+    input = "/media/tv"
+    output = "/media/tv-remuxed"
+    recursive = true
+    exclude = ["Extras", "*/sample-*"]
+
+    [[batch]]
+    input = "/media/films"
+    subs = "none"
+"""
+
+import argparse
+import json
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+from remux_cache import IdentifyCache
+from remux_engine import (ALL_LANGS, RemuxEngine, RemuxOptions, default_jobs, default_scan_jobs, find_mkvmerge,
+                          parse_lang_list)
+from remux_fileops import UNCHANGED_MODES, iter_mkv_files
+from remux_journal import JobJournal
+from remux_metrics import MetricsServer, parse_address
+from remux_sched import DEFAULT_DEVICE_JOBS, ORDER_POLICIES
+from remux_stats import ThroughputModel
+from remux_trace import TraceWriter
+from remux_watch import POLL_INTERVAL, SETTLE_SECONDS, FolderWatcher
+
+# exit codes
+EXIT_OK = 0
+EXIT_FILES_FAILED = 1      # every batch ran, some files failed
+EXIT_USAGE = 2             # bad flags or job spec
+EXIT_NO_MKVMERGE = 3
+EXIT_BATCH_FAILED = 4      # a batch could not run at all (e.g. missing input dir)
+EXIT_INTERRUPTED = 130     # Ctrl+C or SIGTERM
+
+# batch settings: spec key -> (type, default); the same names as the REMUX_Script.py flags
+BATCH_KEYS = {
+    "input": (str, None),
+    "output": (str, None),
+    "audio": (str, None),
+    "subs": (str, ALL_LANGS),
+    "recursive": (bool, False),
+    "exclude": (list, []),
+    "follow_symlinks": (bool, False),
+    "overwrite": (bool, False),
+    "dry_run": (bool, False),
+    "resume": (bool, False),
+    "unchanged": (str, "copy"),
+    "jobs": (int, None),
+    "device_jobs": (int, DEFAULT_DEVICE_JOBS),
+    "order": (str, "name"),
+    "scan_jobs": (int, None),
+    "trace": (str, None),
+}
+
+CHOICES = {
+    "unchanged": UNCHANGED_MODES,
+    "order": ORDER_POLICIES,
+}
+
+
+class SpecError(ValueError):
+    """A job spec or flag combination that cannot be run."""
+
+
+def load_spec_file(path: Path) -> dict:
+    """Parse a .json or .toml job spec. TOML needs Python 3.11+ (tomllib) or the tomli package."""
+    if path.suffix.lower() == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise SpecError("TOML job specs need Python 3.11 or the 'tomli' package; use JSON instead")
+        try:
+            with open(str(path), "rb") as f:
+                return tomllib.load(f)
+        except (OSError, tomllib.TOMLDecodeError) as e:
+            raise SpecError(f"{path}: {e}")
+    try:
+        with open(str(path), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SpecError(f"{path}: {e}")
+    if not isinstance(data, dict):
+        raise SpecError(f"{path}: the top level must be an object")
+    return data
+
+
+def _check(where: str, key: str, value):
+    if key not in BATCH_KEYS:
+        raise SpecError(f"{where}: unknown setting '{key}'")
+    typ = BATCH_KEYS[key][0]
+    if typ is list:
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise SpecError(f"{where}: '{key}' must be a list of strings")
+    elif typ is int:
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise SpecError(f"{where}: '{key}' must be a whole number")
+    elif not isinstance(value, typ):
+        raise SpecError(f"{where}: '{key}' must be a {typ.__name__}")
+    if key in CHOICES and value not in CHOICES[key]:
+        raise SpecError(f"{where}: '{key}' must be one of {', '.join(CHOICES[key])}")
+    return value
+
+
+def resolve_batches(spec: dict, overrides: dict) -> list:
+    """
+    Combine spec defaults, each [[batch]] table and the flags given on the command line (which
+    win) into complete batch settings. A spec without [[batch]] entries is a single batch.
+    """
+    defaults = {key: default for key, (_, default) in BATCH_KEYS.items()}
+    defaults["jobs"] = default_jobs()
+    defaults["scan_jobs"] = default_scan_jobs()
+    top = {k: v for k, v in spec.items() if k != "batch"}
+    entries = spec.get("batch", [{}])
+    if not isinstance(entries, list) or not entries or not all(isinstance(e, dict) for e in entries):
+        raise SpecError("'batch' must be a non-empty list of tables/objects")
+    batches = []
+    for n, entry in enumerate(entries, 1):
+        settings = dict(defaults)
+        for where, source in (("job spec", top), (f"batch {n}", entry), ("command line", overrides)):
+            for key, value in source.items():
+                settings[key] = _check(where, key, value)
+        if not settings["input"]:
+            raise SpecError(f"batch {n}: 'input' is required")
+        if settings["audio"] is None:
+            raise SpecError(f"batch {n}: 'audio' is required (e.g. \"eng\" or \"all\")")
+        if settings["jobs"] < 1 or settings["scan_jobs"] < 1 or settings["device_jobs"] < 0:
+            raise SpecError(f"batch {n}: jobs and scan_jobs must be at least 1, device_jobs at least 0")
+        batches.append(settings)
+    return batches
+
+
+def emit(event: str, **fields):
+    """One machine-readable progress line on stdout."""
+    fields = {"event": event, "t": round(time.time(), 3), **fields}
+    sys.stdout.write(json.dumps(fields, separators=(",", ":")) + "\n")
+    sys.stdout.flush()
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def run_batch(n: int, settings: dict, mkvmerge_path: str, cache, throughput, progress: bool,
+              watch: Optional[dict] = None, metrics: Optional[MetricsServer] = None) -> dict:
+    """
+    Run one batch to completion; returns its final stats snapshot, with "failed" not counting the
+    "cancelled" files. Ctrl+C or SIGTERM cancels the rest of the batch and sets "interrupted" in
+    the result instead of raising, so what was done so far is still reported. With `watch`
+    (FolderWatcher keyword arguments) files are taken from a watcher instead and the batch runs
+    until interrupted. With `metrics`, the endpoint reports this batch while it runs.
+    """
+    input_dir = Path(settings["input"])
+    if not input_dir.is_dir():
+        raise SpecError(f"input directory not found: {input_dir}")
+    output_dir = Path(settings["output"]) if settings["output"] else input_dir / "remuxed"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    audio_langs = parse_lang_list(settings["audio"])
+    if not audio_langs:
+        raise SpecError("at least one audio language must be selected")
+    dry_run = settings["dry_run"]
+
+    options = RemuxOptions(
+        output_dir=output_dir, audio_langs=audio_langs, sub_langs=parse_lang_list(settings["subs"]),
+        input_dir=input_dir, skip_if_exists=not settings["overwrite"], dry_run=dry_run,
+        unchanged=settings["unchanged"], jobs=settings["jobs"], device_jobs=settings["device_jobs"],
+        order=settings["order"], scan_jobs=settings["scan_jobs"])
+    journal = None if dry_run else JobJournal.open_in(output_dir, resume=settings["resume"])
+    trace = TraceWriter(Path(settings["trace"])) if settings["trace"] else None
+    engine = RemuxEngine(mkvmerge_path, options, cache, throughput, journal, trace)
+    if metrics is not None:
+        metrics.attach(engine, batch=n, input=str(input_dir), output=str(output_dir))
+
+    def on_events(events):
+        for ev in events:
+            if ev["type"] != "job":
+                continue
+            job = ev["job"]
+            emit("file", batch=n, no=job["no"], name=job["fullname"], status=job["status_text"],
+                 pct=int(job.get("pct", 0)), elapsed=round(job.get("elapsed") or 0.0, 1),
+                 remaining=None if job.get("remaining") is None else round(job["remaining"], 1),
+                 finished=job["finished"], success=job["success"])
+
+    if progress:
+        engine.subscribe(on_events)
+    log_path = output_dir / "remux_log.txt"
+    engine.write_log_header(log_path, f"{input_dir}{' (recursive)' if settings['recursive'] else ''}")
+    emit("batch_start", batch=n, input=str(input_dir), output=str(output_dir), dry_run=dry_run)
+    if watch is not None:
+        watcher = FolderWatcher(input_dir, settings["recursive"], settings["exclude"], settings["follow_symlinks"],
+                                skip_dirs=[output_dir], **watch)
+        emit("watching", batch=n, input=str(input_dir), backend=watcher.backend)
+        sources = watcher.watch()
+    else:
+        sources = iter_mkv_files(input_dir, settings["recursive"], settings["exclude"],
+                                 settings["follow_symlinks"], skip_dirs=[output_dir])
+    # a watcher yields a path again only when the file was replaced, and then the old output must go
+    seen = set()
+    interrupted = False
+    try:
+        with engine:
+            for src in sources:
+                engine.add(src, overwrite=src in seen)
+                seen.add(src)
+    except KeyboardInterrupt:
+        # for a watcher this is the normal way to stop; files it was working on are cancelled
+        # and redone on the next start
+        interrupted = True
+        log("stopped" if watch is not None else "interrupted")
+    finally:
+        engine.write_log_summary(log_path)
+        if journal is not None:
+            journal.close()
+        if trace is not None:
+            trace.close()
+    batch = engine.stats.snapshot()
+    cancelled = engine.cancelled_count()
+    batch.update(failed=batch["failed"] - cancelled, cancelled=cancelled, interrupted=interrupted)
+    unchanged_count, bytes_saved = engine.unchanged_totals()
+    emit("batch_done", batch=n, total=batch["total"], ok=batch["ok"], failed=batch["failed"], cancelled=cancelled,
+         interrupted=interrupted, elapsed=round(batch["elapsed"], 1), unchanged=unchanged_count,
+         bytes_saved=bytes_saved, log=str(log_path))
+    return batch
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run remux batches unattended from flags or a JSON/TOML job spec. Progress is written to "
+                    f"stdout as JSON lines. Exit codes: {EXIT_OK} all OK, {EXIT_FILES_FAILED} some files failed, "
+                    f"{EXIT_USAGE} bad flags or spec, {EXIT_NO_MKVMERGE} mkvmerge not found, "
+                    f"{EXIT_BATCH_FAILED} a batch could not run, {EXIT_INTERRUPTED} interrupted.")
+    parser.add_argument("--spec", type=Path, help="job spec file (.json or .toml) with one or more batches")
+    parser.add_argument("--progress", choices=("jsonl", "none"), default="jsonl",
+                        help="jsonl: a JSON line per file update; none: batch start/end lines only (default: jsonl)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and remux new files as they arrive in the input folder (one batch only); "
+                             "stop with Ctrl+C or SIGTERM")
+    parser.add_argument("--watch-backend", choices=("auto", "inotify", "polling"), default="auto",
+                        help="how new files are noticed: inotify (Linux) or listing folders every --poll-interval "
+                             "seconds (default: auto, inotify where available)")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="with --watch: seconds a file's size must stay the same before it counts as complete, "
+                             f"unless its writer was seen closing it (default: {SETTLE_SECONDS:g})")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help=f"with --watch: seconds between checks for new or settled files (default: {POLL_INTERVAL:g})")
+    # batch settings; given flags override the spec for every batch
+    parser.add_argument("-i", "--input", help="input directory")
+    parser.add_argument("-o", "--output", help="output directory (default: <input>/remuxed)")
+    parser.add_argument("--audio", help="audio languages to keep, e.g. 'eng,jpn' or 'all'")
+    parser.add_argument("--subs", help="subtitle languages to keep, 'all' or 'none' (default: all)")
+    parser.add_argument("-r", "--recursive", action="store_true", default=None, help="also process subfolders")
+    parser.add_argument("--exclude", action="append", metavar="PATTERN",
+                        help="skip files and folders matching this glob pattern (repeatable)")
+    parser.add_argument("--follow-symlinks", action="store_true", default=None,
+                        help="with --recursive: descend into symlinked folders")
+    parser.add_argument("--overwrite", action="store_true", default=None, help="remux even if the output exists")
+    parser.add_argument("--dry-run", action="store_true", default=None, help="only log what would be done")
+    parser.add_argument("--resume", action="store_true", default=None,
+                        help="continue interrupted batches from the journal in their output dir")
+    parser.add_argument("--unchanged", choices=UNCHANGED_MODES,
+                        help="what to do with files that already contain only the selected tracks (default: copy)")
+    parser.add_argument("-j", "--jobs", type=int, help=f"files remuxed in parallel (default: {default_jobs()})")
+    parser.add_argument("--device-jobs", type=int,
+                        help=f"jobs reading or writing the same disk at once (e.g. 1-2 for spinning disks), 0 = no limit "
+                             f"(default: {DEFAULT_DEVICE_JOBS})")
+    parser.add_argument("--order", choices=ORDER_POLICIES, help="order in which files are started (default: name)")
+    parser.add_argument("--scan-jobs", type=int,
+                        help=f"files identified in parallel (default: {default_scan_jobs()})")
+    parser.add_argument("--metrics", metavar="[HOST:]PORT",
+                        help="serve the running batch's state as JSON (/status) and Prometheus text (/metrics) "
+                             "on this address; a bare port listens on localhost only")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="append a JSONL per-phase timing trace of every file to FILE")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not read or write the persistent track identification cache")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    overrides = {key: getattr(args, key) for key in BATCH_KEYS if getattr(args, key) is not None}
+    try:
+        spec = load_spec_file(args.spec) if args.spec is not None else {}
+        batches = resolve_batches(spec, overrides)
+        if args.watch and len(batches) != 1:
+            raise SpecError("--watch runs exactly one batch")
+        if args.settle < 0 or args.poll_interval <= 0:
+            raise SpecError("--settle must not be negative and --poll-interval must be positive")
+        metrics_address = parse_address(args.metrics) if args.metrics else None
+    except (SpecError, ValueError) as e:
+        log(f"error: {e}")
+        return EXIT_USAGE
+
+    mkvmerge_path = find_mkvmerge()
+    if not mkvmerge_path:
+        log("error: mkvmerge not found on PATH. Install MKVToolNix or add mkvmerge to PATH.")
+        return EXIT_NO_MKVMERGE
+
+    # cron and pipeline runners stop jobs with SIGTERM; treat it like Ctrl+C so running
+    # mkvmerge processes are killed and temp files removed
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+
+    metrics = None
+    if metrics_address is not None:
+        try:
+            metrics = MetricsServer(*metrics_address)
+        except OSError as e:
+            log(f"error: cannot serve metrics on {args.metrics}: {e}")
+            return EXIT_USAGE
+        emit("metrics", url=metrics.url)
+
+    cache = None if args.no_cache else IdentifyCache.open_default()
+    throughput = ThroughputModel.open_default()
+    watch = None
+    if args.watch:
+        watch = {"settle": args.settle, "poll_interval": args.poll_interval, "backend": args.watch_backend}
+    code = EXIT_OK
+    totals = {"ok": 0, "failed": 0, "cancelled": 0, "batches_failed": 0}
+    try:
+        for n, settings in enumerate(batches, 1):
+            try:
+                batch = run_batch(n, settings, mkvmerge_path, cache, throughput, args.progress == "jsonl", watch,
+                                  metrics)
+            except (SpecError, OSError) as e:
+                log(f"batch {n}: {e}")
+                emit("batch_error", batch=n, input=settings["input"], error=str(e))
+                totals["batches_failed"] += 1
+                code = EXIT_BATCH_FAILED
+                continue
+            totals["ok"] += batch["ok"]
+            totals["failed"] += batch["failed"]
+            totals["cancelled"] += batch["cancelled"]
+            if batch["interrupted"]:
+                code = EXIT_INTERRUPTED
+                break
+            if batch["failed"] and code == EXIT_OK:
+                code = EXIT_FILES_FAILED
+    except KeyboardInterrupt:
+        log("interrupted")
+        code = EXIT_INTERRUPTED
+    finally:
+        if metrics is not None:
+            metrics.close()
+        if cache is not None:
+            cache.close()
+        throughput.save()
+    emit("done", batches=len(batches), exit_code=code, **totals)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
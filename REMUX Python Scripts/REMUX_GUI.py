@@ -4,154 +4,63 @@ remux_gui.py
 A GUI for the batch remuxing script with automatic language detection, built with tkinter.
 """
 
-import json
 import queue
-import shutil
-import subprocess
-import sys
 import threading
 import time
-import re
 from pathlib import Path
 from typing import Optional
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
-# --- Core Remuxing Logic (adapted from the original script) ---
-
-def find_mkvmerge() -> Optional[str]:
-    mk = shutil.which("mkvmerge") or shutil.which("mkvmerge.exe")
-    if mk:
-        return mk
-    candidate = r"C:\Program Files\MKVToolNix\mkvmerge.exe"
-    return candidate if Path(candidate).exists() else None
-
-def identify_tracks(mkvmerge_path: str, src: Path, timeout: float = 10.0):
-    cmd = [mkvmerge_path, "--identify", "--identification-format", "json", str(src)]
-    try:
-        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout, check=False)
-        if res.returncode != 0:
-            return {"ok": False, "err": res.stderr.strip() or res.stdout.strip() or f"rc={res.returncode}"}
-        return {"ok": True, "data": json.loads(res.stdout)}
-    except Exception as e:
-        return {"ok": False, "err": str(e)}
-
-def get_available_languages(mkvmerge_path: str, files: list):
-    """Scan all files and return available audio and subtitle languages."""
-    all_audio_langs = set()
-    all_sub_langs = set()
-    
-    for file in files:
-        ident = identify_tracks(mkvmerge_path, file)
-        if not ident["ok"]:
-            continue
-        
-        for track in ident["data"].get("tracks", []):
-            track_type = track.get("type", "").lower()
-            lang = track.get("properties", {}).get("language", "und").lower()
-            
-            if track_type == "audio":
-                all_audio_langs.add(lang)
-            elif track_type in ("subtitles", "subtitle"):
-                all_sub_langs.add(lang)
-    
-    return sorted(all_audio_langs), sorted(all_sub_langs)
-
-def fmt_time(sec: Optional[float]) -> str:
-    if sec is None:
-        return "--:--"
-    try:
-        s = int(round(sec))
-        m, s = divmod(s, 60)
-        return f"{m:02d}:{s:02d}"
-    except (ValueError, TypeError):
-        return "--:--"
-
-def remux_file(mkvmerge_path: str, src_path: Path, out_path: Path, audio_langs: list, sub_langs: list,
-               skip_if_exists: bool, dry_run: bool, update_queue: queue.Queue, row_idx: int):
-    """
-    Performs the remux operation for a single file and sends progress updates to the GUI queue.
-    """
-    start_time = time.time()
-    
-    def send_update(data):
-        data['row_idx'] = row_idx
-        update_queue.put(data)
-
-    send_update({"status": "Pending", "pct": 0, "elapsed": 0, "remaining": None})
-
-    if skip_if_exists and out_path.exists() and out_path.stat().st_size > 0:
-        send_update({"status": "Skipped (exists)", "pct": 100, "elapsed": 0, "finished": True, "success": True})
-        return
-
-    ident = identify_tracks(mkvmerge_path, src_path)
-    if not ident["ok"]:
-        send_update({"status": f"ID Failed", "pct": 0, "finished": True, "success": False})
-        return
-
-    audio_ids = [
-        t["id"] for t in ident["data"].get("tracks", [])
-        if t.get("type") == "audio" and (t.get("properties", {}).get("language") or "und").lower() in audio_langs
-    ]
-    sub_ids = [
-        t["id"] for t in ident["data"].get("tracks", [])
-        if t.get("type") in ("subtitles", "subtitle") and (t.get("properties", {}).get("language") or "und").lower() in sub_langs
-    ]
-
-    if not audio_ids:
-        send_update({"status": "No desired audio", "pct": 0, "finished": True, "success": False})
-        return
-
-    cmd = [mkvmerge_path, "-o", str(out_path), "--audio-tracks", ",".join(map(str, audio_ids))]
-    if sub_ids:
-        cmd += ["--subtitle-tracks", ",".join(map(str, sub_ids))]
-    else:
-        cmd += ["--no-subtitles"]
-    cmd += ["--ui-language", "en", "--gui-mode", str(src_path)]
-
-    if dry_run:
-        send_update({"status": "Dry-run (skipped)", "pct": 100, "finished": True, "success": True})
-        return
-
-    try:
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                text=True, bufsize=1, encoding="utf-8", errors="replace")
-    except Exception as e:
-        send_update({"status": "Launch failed", "pct": 0, "finished": True, "success": False})
-        return
-
-    re_progress = re.compile(r"(?:#GUI#progress|Progress:)\s*([0-9]{1,3})")
-    
-    for line in iter(proc.stdout.readline, ""):
-        m = re_progress.search(line)
-        if m:
-            pct = int(m.group(1))
-            elapsed = time.time() - start_time
-            remaining = (elapsed * (100 - pct) / pct) if pct > 0 else None
-            send_update({"status": "Processing", "pct": pct, "elapsed": elapsed, "remaining": remaining})
-    
-    proc.wait()
-    final_elapsed = time.time() - start_time
-
-    if proc.returncode == 0 and out_path.exists() and out_path.stat().st_size > 0:
-        send_update({"status": "OK", "pct": 100, "elapsed": final_elapsed, "remaining": 0, "finished": True, "success": True})
-    else:
-        send_update({"status": f"FAILED (rc={proc.returncode})", "elapsed": final_elapsed, "finished": True, "success": False})
+from remux_cache import IdentifyCache
+from remux_engine import (RemuxEngine, RemuxOptions, default_jobs, find_mkvmerge, fmt_size, fmt_time,
+                          get_available_languages, parse_lang_list)
+from remux_fileops import iter_mkv_files
+from remux_journal import JobJournal
+from remux_proc import supervisor
+from remux_sched import DEFAULT_DEVICE_JOBS
+from remux_stats import ThroughputModel
 
 
 # --- GUI Application ---
 
+# "Already matching" choices: label shown in the GUI -> remux_fileops mode
+UNCHANGED_CHOICES = [
+    ("Copy", "copy"),
+    ("Hard link", "link"),
+    ("Reflink", "reflink"),
+    ("Skip", "skip"),
+    ("Remux anyway", "remux"),
+]
+
+# "Start order" labels -> remux_sched.ORDER_POLICIES
+ORDER_CHOICES = [
+    ("By name", "name"),
+    ("Largest first", "largest"),
+    ("Smallest first", "smallest"),
+]
+
+# update_queue polling interval and the most event batches handled per poll
+QUEUE_POLL_MS = 100
+QUEUE_BUDGET = 5000
+
 class RemuxApp:
     def __init__(self, root):
         self.root = root
         self.root.title("MKV Batch Remuxer")
         self.root.geometry("950x700")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.mkvmerge_path = find_mkvmerge()
+        self.identify_cache = IdentifyCache.open_default()
         self.update_queue = queue.Queue()
         self.running = False
+        self.engine = None
+        self.log_path = None
+        self.throughput = ThroughputModel.open_default()
         self.available_audio_langs = []
         self.available_sub_langs = []
+        self.tracks_by_file = {}
 
         # --- UI Setup ---
         main_frame = ttk.Frame(root, padding="10")
@@ -172,6 +81,18 @@ class RemuxApp:
         ttk.Entry(io_frame, textvariable=self.output_dir).grid(row=1, column=1, sticky=tk.EW)
         ttk.Button(io_frame, text="Browse...", command=self.browse_output).grid(row=1, column=2, padx=5)
 
+        walk_frame = ttk.Frame(io_frame)
+        walk_frame.grid(row=2, column=1, sticky=tk.W)
+        self.recursive = tk.BooleanVar(value=False)
+        ttk.Checkbutton(walk_frame, text="Include subfolders (mirrored in output)", variable=self.recursive).pack(side=tk.LEFT)
+        self.follow_symlinks = tk.BooleanVar(value=False)
+        ttk.Checkbutton(walk_frame, text="Follow symlinked folders", variable=self.follow_symlinks).pack(side=tk.LEFT, padx=10)
+
+        ttk.Label(io_frame, text="Exclude:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=2)
+        self.exclude = tk.StringVar()
+        ttk.Entry(io_frame, textvariable=self.exclude).grid(row=3, column=1, sticky=tk.EW)
+        ttk.Label(io_frame, text="(e.g., Extras,*/sample-*)", foreground="gray", font=("TkDefaultFont", 8)).grid(row=3, column=2, sticky=tk.W, padx=5)
+
         # Available Languages Display Frame
         avail_frame = ttk.LabelFrame(main_frame, text="Available Languages in MKV Files", padding="10")
         avail_frame.pack(fill=tk.X, pady=5)
@@ -223,6 +144,30 @@ class RemuxApp:
         self.dry_run = tk.BooleanVar(value=False)
         ttk.Checkbutton(opts_frame, text="Dry-run only", variable=self.dry_run).grid(row=3, column=2, columnspan=2, sticky=tk.W, padx=5, pady=5)
 
+        ttk.Label(opts_frame, text="Parallel jobs:").grid(row=4, column=0, sticky=tk.W, padx=5)
+        self.jobs = tk.IntVar(value=default_jobs())
+        ttk.Spinbox(opts_frame, from_=1, to=16, width=5, textvariable=self.jobs).grid(row=4, column=1, sticky=tk.W, padx=5)
+
+        ttk.Label(opts_frame, text="Already matching:").grid(row=5, column=0, sticky=tk.W, padx=5)
+        self.unchanged_mode = tk.StringVar(value=UNCHANGED_CHOICES[0][0])
+        ttk.Combobox(opts_frame, textvariable=self.unchanged_mode, state="readonly", width=18,
+                     values=[label for label, _ in UNCHANGED_CHOICES]).grid(row=5, column=1, sticky=tk.W, padx=5, pady=5)
+
+        ttk.Label(opts_frame, text="Jobs per disk (0 = no limit):").grid(row=5, column=2, sticky=tk.W, padx=5)
+        self.device_jobs = tk.IntVar(value=DEFAULT_DEVICE_JOBS)
+        ttk.Spinbox(opts_frame, from_=0, to=16, width=5, textvariable=self.device_jobs).grid(row=5, column=3, sticky=tk.W, padx=5)
+
+        ttk.Label(opts_frame, text="Start order:").grid(row=6, column=0, sticky=tk.W, padx=5)
+        self.order = tk.StringVar(value=ORDER_CHOICES[0][0])
+        ttk.Combobox(opts_frame, textvariable=self.order, state="readonly", width=18,
+                     values=[label for label, _ in ORDER_CHOICES]).grid(row=6, column=1, sticky=tk.W, padx=5, pady=5)
+
+        self.resume = tk.BooleanVar(value=False)
+        ttk.Checkbutton(opts_frame, text="Resume interrupted batch", variable=self.resume).grid(row=6, column=2, columnspan=2, sticky=tk.W, padx=5, pady=5)
+
+        self.fast_scan = tk.BooleanVar(value=True)
+        ttk.Checkbutton(opts_frame, text="Fast scan (read MKV headers directly)", variable=self.fast_scan).grid(row=4, column=2, columnspan=2, sticky=tk.W, padx=5, pady=5)
+
         # File List / Progress Table
         tree_frame = ttk.Frame(main_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True, pady=5)
@@ -273,9 +218,25 @@ class RemuxApp:
         if path:
             self.output_dir.set(path)
 
+    def on_close(self):
+        # drop queued files and kill running mkvmerge processes rather than leaving them behind
+        if self.running and self.engine is not None:
+            self.engine.cancel()
+        else:
+            supervisor().cancel_all()
+        self.root.destroy()
+
     def show_error(self, message):
         messagebox.showerror("Error", message)
 
+    def find_mkv_files(self, input_path: Path, output_path: Optional[Path] = None) -> list:
+        """MKV files to process, honouring the subfolder, symlink and exclude options, in relative path order."""
+        exclude = [pat.strip() for pat in self.exclude.get().split(",") if pat.strip()]
+        # an output dir inside the input tree holds earlier results; never pick those up again
+        skip_dirs = [output_path] if output_path is not None else [input_path / "remuxed"]
+        files = iter_mkv_files(input_path, self.recursive.get(), exclude, self.follow_symlinks.get(), skip_dirs)
+        return sorted(files, key=lambda f: f.relative_to(input_path).as_posix())
+
     def scan_languages(self):
         """Automatically scan MKV files and display available languages."""
         input_path = Path(self.input_dir.get())
@@ -283,7 +244,8 @@ class RemuxApp:
         if not input_path.is_dir():
             return
         
-        mkv_files = sorted(input_path.glob("*.mkv"))
+        output_dir = self.output_dir.get()
+        mkv_files = self.find_mkv_files(input_path, Path(output_dir) if output_dir else None)
         if not mkv_files:
             self.avail_audio_label.config(text="No MKV files found", foreground="red")
             self.avail_sub_label.config(text="No MKV files found", foreground="red")
@@ -296,16 +258,36 @@ class RemuxApp:
         self.root.update()
         
         # Run scan in separate thread to avoid freezing GUI
+        backend = "auto" if self.fast_scan.get() else "mkvmerge"
+        last_post = [0.0]
+
+        def on_progress(scanned, total, failed, audio_langs, sub_langs):
+            # throttle so large scans do not flood the Tk event loop
+            now = time.time()
+            if now - last_post[0] < 0.2 and scanned < total:
+                return
+            last_post[0] = now
+            self.root.after(0, lambda: self.show_scan_progress(scanned, total, failed, audio_langs, sub_langs))
+
         def scan_thread():
-            audio_langs, sub_langs = get_available_languages(self.mkvmerge_path, mkv_files)
-            self.root.after(0, lambda: self.update_available_languages(audio_langs, sub_langs))
+            audio_langs, sub_langs, tracks_by_file = get_available_languages(
+                self.mkvmerge_path, mkv_files, self.identify_cache, on_progress=on_progress, backend=backend)
+            self.root.after(0, lambda: self.update_available_languages(audio_langs, sub_langs, tracks_by_file))
         
         threading.Thread(target=scan_thread, daemon=True).start()
 
-    def update_available_languages(self, audio_langs, sub_langs):
+    def show_scan_progress(self, scanned, total, failed, audio_langs, sub_langs):
+        """Show the languages found so far while the scan is still running."""
+        progress = f"(scanning {scanned}/{total}" + (f", {failed} failed)" if failed else ")")
+        self.avail_audio_label.config(text=f"{', '.join(audio_langs) or '...'}  {progress}", foreground="blue")
+        self.avail_sub_label.config(text=f"{', '.join(sub_langs) or '...'}  {progress}", foreground="blue")
+        self.status_label.config(text=f"Scanning files for available languages... {scanned}/{total}")
+
+    def update_available_languages(self, audio_langs, sub_langs, tracks_by_file=None):
         """Update the display with scanned languages."""
         self.available_audio_langs = audio_langs
         self.available_sub_langs = sub_langs
+        self.tracks_by_file = tracks_by_file or {}
         
         if audio_langs:
             audio_text = ", ".join(audio_langs)
@@ -346,25 +328,54 @@ class RemuxApp:
             self.show_error("Invalid input directory.")
             return
         
-        audio_langs = [lang.strip() for lang in self.audio_langs.get().lower().split(',') if lang.strip()]
+        audio_langs = parse_lang_list(self.audio_langs.get())
         if not audio_langs:
             self.show_error("At least one audio language is required.")
             return
             
-        sub_langs = [lang.strip() for lang in self.sub_langs.get().lower().split(',') if lang.strip()]
+        sub_langs = parse_lang_list(self.sub_langs.get())
+
+        try:
+            jobs = int(self.jobs.get())
+        except (tk.TclError, ValueError):
+            jobs = 0
+        if jobs < 1:
+            self.show_error("Parallel jobs must be a whole number of at least 1.")
+            return
+        try:
+            device_jobs = int(self.device_jobs.get())
+        except (tk.TclError, ValueError):
+            device_jobs = -1
+        if device_jobs < 0:
+            self.show_error("Jobs per disk must be a whole number (0 for no limit).")
+            return
 
-        mkv_files = sorted(input_path.glob("*.mkv"))
+        mkv_files = self.find_mkv_files(input_path, output_path)
         if not mkv_files:
             self.status_label.config(text="No .mkv files found in the input directory.")
             return
 
         output_path.mkdir(parents=True, exist_ok=True)
-        
+
+        options = RemuxOptions(
+            output_dir=output_path, audio_langs=audio_langs, sub_langs=sub_langs, input_dir=input_path,
+            skip_if_exists=self.skip_exists.get(), dry_run=self.dry_run.get(),
+            unchanged=dict(UNCHANGED_CHOICES).get(self.unchanged_mode.get(), "copy"),
+            jobs=jobs, device_jobs=device_jobs, order=dict(ORDER_CHOICES).get(self.order.get(), "name"))
+        # per-file journal in the output dir; with "Resume" files finished by an interrupted run are left alone
+        journal = None if options.dry_run else JobJournal.open_in(output_path, resume=self.resume.get())
+        self.engine = RemuxEngine(self.mkvmerge_path, options, self.identify_cache, self.throughput, journal)
+        # engine events arrive on its event thread; Tk is only touched from process_queue
+        self.engine.subscribe(self.update_queue.put)
+        self.log_path = output_path / "remux_log.txt"
+
         self.tree.delete(*self.tree.get_children())
+        # job keys are assigned in add order, which is the order of mkv_files
         self.file_map = {}
         for i, f in enumerate(mkv_files):
-            item_id = self.tree.insert("", "end", values=(f.name, "", "0%", "--:--/--:--", "Pending"))
-            self.file_map[i] = {"id": item_id, "path": f}
+            name = self.engine.name_of(f)
+            item_id = self.tree.insert("", "end", values=(name, "", "0%", "--:--/--:--", "Pending"))
+            self.file_map[i] = {"id": item_id, "path": f, "name": name}
 
         self.running = True
         self.start_button.config(state=tk.DISABLED)
@@ -372,62 +383,98 @@ class RemuxApp:
 
         self.worker_thread = threading.Thread(
             target=self.run_batch_thread,
-            args=(mkv_files, output_path, audio_langs, sub_langs, self.skip_exists.get(), self.dry_run.get()),
+            args=(self.engine, mkv_files, f"{input_path}{' (recursive)' if self.recursive.get() else ''}"),
             daemon=True
         )
         self.worker_thread.start()
         self.root.after(100, self.process_queue)
 
-    def run_batch_thread(self, mkv_files, output_path, audio_langs, sub_langs, skip_exists, dry_run):
-        for i, src_path in enumerate(mkv_files):
-            out_path = output_path / src_path.name
-            remux_file(self.mkvmerge_path, src_path, out_path, audio_langs, sub_langs,
-                       skip_exists, dry_run, self.update_queue, i)
-        self.update_queue.put({"type": "finished"})
+    def run_batch_thread(self, engine, mkv_files, input_desc):
+        error = None
+        try:
+            with engine:
+                engine.write_log_header(self.log_path, input_desc)
+                # identify results from the language scan are reused unless the file changed since
+                for src_path in mkv_files:
+                    engine.add(src_path, self.tracks_by_file.get(src_path))
+            engine.write_log_summary(self.log_path)
+            self.throughput.save()
+        except Exception as e:
+            error = str(e)
+        finally:
+            if engine.journal is not None:
+                engine.journal.close()
+            # always the last event of a run, so the GUI leaves "Processing" even if the batch broke off
+            self.update_queue.put([{"type": "finished", "error": error}])
 
     def process_queue(self):
+        """
+        Apply queued engine events. Each row is redrawn at most once per tick with its latest
+        state, and at most QUEUE_BUDGET event batches are drained per tick so the Tk main loop
+        stays responsive however fast the workers report.
+        """
+        pending = {}
+        finished = False
+        error = None
+        backlog = False
         try:
-            while not self.update_queue.empty():
-                msg = self.update_queue.get_nowait()
-
-                if msg.get("type") == "finished":
-                    self.running = False
-                    self.start_button.config(state=tk.NORMAL)
-                    ok_count = sum(1 for i in self.file_map.values() if self.tree.item(i['id'])['values'][4] == "OK")
-                    fail_count = len(self.file_map) - ok_count
-                    self.status_label.config(text=f"Completed. OK: {ok_count}, Failed: {fail_count}.")
+            for _ in range(QUEUE_BUDGET):
+                try:
+                    events = self.update_queue.get_nowait()
+                except queue.Empty:
+                    break
+                for event in events:
+                    if event["type"] == "job":
+                        pending[event["key"]] = event["job"]
+                    elif event["type"] == "finished":
+                        finished = True
+                        error = event["error"]
+            else:
+                backlog = True
+
+            for key, job in pending.items():
+                self.apply_row_update(key, job)
+
+            if finished:
+                self.running = False
+                self.start_button.config(state=tk.NORMAL)
+                batch = self.engine.stats.snapshot()
+                if error is not None:
+                    self.status_label.config(text=f"Stopped by an error after {batch['ok']} OK, "
+                                                  f"{batch['failed']} failed: {error}")
+                    self.show_error(f"The batch stopped because of an error:\n{error}")
                     return
+                summary = f"Completed. OK: {batch['ok']}, Failed: {batch['failed']}."
+                unchanged_count, bytes_saved = self.engine.unchanged_totals()
+                if unchanged_count:
+                    summary += f" Not remuxed (already matching): {unchanged_count}, {fmt_size(bytes_saved)} saved."
+                self.status_label.config(text=f"{summary} Log: {self.log_path}")
+                return
 
-                row_idx = msg.get("row_idx")
-                if row_idx is None:
-                    continue
-
-                item_id = self.file_map[row_idx]["id"]
-                
-                pct = msg.get("pct", self.tree.set(item_id, "pct"))
-                pct_val = int(pct) if isinstance(pct, (int, float)) else int(str(pct).replace('%',''))
-                
-                bar = "█" * (pct_val // 5) + "░" * (20 - (pct_val // 5))
-                
-                elapsed = msg.get("elapsed")
-                remaining = msg.get("remaining")
-                
-                time_str = f"{fmt_time(elapsed)}/{fmt_time(remaining)}"
-                
-                status = msg.get("status", self.tree.set(item_id, "status"))
-
-                self.tree.item(item_id, values=(
-                    self.file_map[row_idx]["path"].name,
-                    bar,
-                    f"{pct_val}%",
-                    time_str,
-                    status
-                ))
+            if self.running:
+                b = self.engine.stats.snapshot()
+                self.status_label.config(
+                    text=f"Processing: {b['done']}/{b['total']} done, {b['running']} running, "
+                         f"{b['pct']}% - remaining {fmt_time(b['remaining'])}")
 
         finally:
             if self.running:
-                self.root.after(100, self.process_queue)
-
+                # come back sooner while there is a backlog to work through
+                self.root.after(10 if backlog else QUEUE_POLL_MS, self.process_queue)
+
+    def apply_row_update(self, key, job):
+        """Redraw one tree row from the engine's job state."""
+        pct_val = int(job.get("pct", 0))
+        bar = "█" * (pct_val // 5) + "░" * (20 - (pct_val // 5))
+        time_str = f"{fmt_time(job.get('elapsed'))}/{fmt_time(job.get('remaining'))}"
+
+        self.tree.item(self.file_map[key]["id"], values=(
+            self.file_map[key]["name"],
+            bar,
+            f"{pct_val}%",
+            time_str,
+            job.get("status_text", "")
+        ))
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -6,64 +6,70 @@ Rich live table UI with improved layout: separate % column, persistent progress
 separate result column, and gap before batch row.
 """
 
-import json
-import queue
-import shutil
-import subprocess
+import argparse
 import sys
 import threading
 import time
-import re
+from collections import deque
 from pathlib import Path
 from typing import Optional
 
 from rich.console import Console
 from rich.table import Table
 from rich.live import Live
+from rich.progress import BarColumn, Progress, TextColumn
+
+import remux_engine
+from remux_cache import IdentifyCache
+from remux_engine import (ALL_LANGS, RemuxEngine, RemuxOptions, default_jobs, default_scan_jobs, find_mkvmerge,
+                          fmt_size, fmt_time, parse_lang_list)
+from remux_fileops import UNCHANGED_MODES, iter_mkv_files
+from remux_journal import JobJournal
+from remux_metrics import MetricsServer, parse_address
+from remux_sched import DEFAULT_DEVICE_JOBS, ORDER_POLICIES
+from remux_stats import BatchStats, ThroughputModel
+from remux_trace import TraceWriter
 
 console = Console()
 
-# ---------- Helpers ----------
+# table redraw rate; progress events only mark the table dirty
+RENDER_FPS = 4
+# redraw at least this often so elapsed clocks keep ticking without progress events
+RENDER_HEARTBEAT = 1.0
+# batches larger than this use the compact table with --view auto
+COMPACT_VIEW_THRESHOLD = 30
+# rows kept visible in the compact table
+RECENT_ROWS = 5
+FAILURE_ROWS = 10
 
-def find_mkvmerge() -> Optional[str]:
-    mk = shutil.which("mkvmerge") or shutil.which("mkvmerge.exe")
-    if mk:
-        return mk
-    candidate = r"C:\Program Files\MKVToolNix\mkvmerge.exe"
-    return candidate if Path(candidate).exists() else None
+# ---------- Helpers ----------
 
-def identify_tracks(mkvmerge_path: str, src: Path, timeout: float = 10.0):
-    cmd = [mkvmerge_path, "--identify", "--identification-format", "json", str(src)]
-    try:
-        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout, check=False)
-        if res.returncode != 0:
-            return {"ok": False, "err": res.stderr.strip() or res.stdout.strip() or f"rc={res.returncode}"}
-        return {"ok": True, "data": json.loads(res.stdout)}
-    except Exception as e:
-        return {"ok": False, "err": str(e)}
-
-def get_available_languages(mkvmerge_path: str, files: list):
-    """Scan all MKV files and return available audio and subtitle languages."""
-    all_audio_langs = set()
-    all_sub_langs = set()
-    
+def get_available_languages(mkvmerge_path: str, files: list, cache: Optional[IdentifyCache] = None,
+                            jobs: Optional[int] = None, backend: str = "mkvmerge"):
+    """
+    Scan all MKV files and return available audio and subtitle languages, plus a
+    {path: identify result} table so the remux phase does not identify each file again.
+    Files are identified in parallel; progress and the languages found so far are shown live.
+    """
     console.print("\n[yellow]Scanning files for available languages...[/yellow]")
-    
-    for file in files:
-        ident = identify_tracks(mkvmerge_path, file)
-        if not ident["ok"]:
-            continue
-        
-        for track in ident["data"].get("tracks", []):
-            track_type = track.get("type", "").lower()
-            lang = track.get("properties", {}).get("language", "und").lower()
-            
-            if track_type == "audio":
-                all_audio_langs.add(lang)
-            elif track_type in ("subtitles", "subtitle"):
-                all_sub_langs.add(lang)
-    
-    return sorted(all_audio_langs), sorted(all_sub_langs)
+    failed_count = [0]
+
+    with Progress(TextColumn("{task.description}"), BarColumn(), TextColumn("{task.completed}/{task.total}"),
+                  TextColumn("[red]{task.fields[failed]} failed[/red]"), TextColumn("[cyan]{task.fields[langs]}[/cyan]"),
+                  console=console) as progress:
+        task = progress.add_task("Identifying", total=len(files), failed=0, langs="")
+
+        def on_progress(scanned, total, failed, audio_langs, sub_langs):
+            failed_count[0] = failed
+            progress.update(task, completed=scanned, failed=failed,
+                            langs=shorten("audio: " + ", ".join(audio_langs), 40))
+
+        result = remux_engine.get_available_languages(mkvmerge_path, files, cache, jobs, on_progress, backend)
+
+    if failed_count[0]:
+        console.print(f"[yellow]{failed_count[0]} file(s) could not be identified and will be retried during remux.[/yellow]")
+
+    return result
 
 def prompt_language_selection(audio_langs_available, sub_langs_available):
     """Prompt user to select languages from available options."""
@@ -103,37 +109,9 @@ def shorten(name: str, max_len: int = 40) -> str:
     half = (max_len - 3) // 2
     return name[:half] + "..." + name[-half:]
 
-def fmt_time(sec: Optional[float]) -> str:
-    if sec is None:
-        return "--:--"
-    try:
-        s = int(round(sec))
-        m = s // 60
-        ss = s % 60
-        return f"{m:02d}:{ss:02d}"
-    except Exception:
-        return "--:--"
-
-def _start_stdout_reader(stream, q: queue.Queue):
-    def _reader():
-        try:
-            for ln in iter(stream.readline, ""):
-                q.put(ln)
-        except Exception:
-            pass
-        finally:
-            try:
-                stream.close()
-            except Exception:
-                pass
-    t = threading.Thread(target=_reader, daemon=True)
-    t.start()
-    return t
-
 # ---------- Rendering ----------
 
-def build_table(rows, batch_info):
-    """Return a rich.Table based on current rows and batch_info dict."""
+def _new_table():
     table = Table(show_header=True, header_style="bold magenta", expand=False)
     table.add_column("SL No.", width=6, justify="right")
     table.add_column("Filename", width=40, overflow="fold")
@@ -143,47 +121,46 @@ def build_table(rows, batch_info):
     table.add_column("Remaining", width=10, justify="right")
     table.add_column("Status", width=12)
     table.add_column("Result", width=8, justify="center")
+    return table
 
-    for i, r in enumerate(rows):
-        # filename (without checkmark/cross - those go in Result column)
-        fname_display = f"[cyan]{r['display_name']}[/cyan]"
-
-        # progress bar - always show, regardless of completion status
-        pct = int(r.get("pct", 0))
-        blocks = pct // 5  # 20 blocks total
-        bar = "█" * blocks + "░" * (20 - blocks)
-        progress_cell = f"[white]{bar}[/white]"
-
-        # percentage column - green color
-        pct_display = f"[green]{pct:3d}%[/green]"
-
-        elapsed = fmt_time(r.get("elapsed"))
-        remaining = fmt_time(r.get("remaining")) if r.get("remaining") is not None else "--:--"
-        status_text = r.get("status_text", "")
-
-        # result column (checkmark or cross)
-        result = ""
-        if r.get("finished"):
-            if r["success"]:
-                result = "[green]✓[/green]"
-            else:
-                result = "[red]✗[/red]"
-
-        table.add_row(
-            str(r["no"]), 
-            fname_display, 
-            progress_cell, 
-            pct_display,
-            elapsed, 
-            remaining, 
-            status_text,
-            result
-        )
-        
-        # Add separator row after each file (except the last one)
-        if i < len(rows) - 1:
-            table.add_row("", "", "", "", "", "", "", "")
+def _row_cells(r):
+    """Cells for one file row."""
+    # filename (without checkmark/cross - those go in Result column)
+    fname_display = f"[cyan]{shorten(r['fullname'], 40)}[/cyan]"
+
+    # progress bar - always show, regardless of completion status
+    pct = int(r.get("pct", 0))
+    blocks = pct // 5  # 20 blocks total
+    bar = "█" * blocks + "░" * (20 - blocks)
+    progress_cell = f"[white]{bar}[/white]"
+
+    # percentage column - green color
+    pct_display = f"[green]{pct:3d}%[/green]"
+
+    elapsed = fmt_time(r.get("elapsed"))
+    remaining = fmt_time(r.get("remaining")) if r.get("remaining") is not None else "--:--"
+    status_text = r.get("status_text", "")
+
+    # result column (checkmark or cross)
+    result = ""
+    if r.get("finished"):
+        if r["success"]:
+            result = "[green]✓[/green]"
+        else:
+            result = "[red]✗[/red]"
+
+    return (
+        str(r["no"]), 
+        fname_display, 
+        progress_cell, 
+        pct_display,
+        elapsed, 
+        remaining, 
+        status_text,
+        result
+    )
 
+def _add_batch_row(table, batch_info):
     # Add an empty row for separation before batch row
     table.add_row("", "", "", "", "", "", "", "")
 
@@ -212,241 +189,207 @@ def build_table(rows, batch_info):
         batch_status,
         batch_result
     )
-    
+
+def build_table(rows, batch_info):
+    """Return a rich.Table based on current rows and batch_info dict."""
+    table = _new_table()
+
+    for i, r in enumerate(rows):
+        table.add_row(*_row_cells(r))
+        
+        # Add separator row after each file (except the last one)
+        if i < len(rows) - 1:
+            table.add_row("", "", "", "", "", "", "", "")
+
+    _add_batch_row(table, batch_info)
     return table
 
-# ---------- Remux function (updates rows in place and refreshes live) ----------
+def build_compact_table(running, recent, failures, batch_info):
+    """
+    Return a rich.Table for large batches: in-flight rows, the last few finished rows,
+    recent failures and aggregate counters. Size depends on the visible rows only.
+    """
+    table = _new_table()
 
-def remux_file_and_update(mkvmerge_path: str, src_path: Path, out_path: Path, row_idx: int,
-                          rows, live: Live, batch_start: float, completed_times: list, log_commands: list,
-                          skip_if_exists: bool, dry_run: bool, audio_langs: list, sub_langs: list):
+    for r in running:
+        table.add_row(*_row_cells(r))
+
+    if recent:
+        table.add_row("", "[dim]Recently finished[/dim]", "", "", "", "", "", "")
+        for r in recent:
+            table.add_row(*_row_cells(r))
+
+    if batch_info["failed"]:
+        more = batch_info["failed"] - len(failures)
+        title = f"[red]Failed ({batch_info['failed']})[/red]" + (f" [dim]- last {len(failures)} shown[/dim]" if more > 0 else "")
+        table.add_row("", title, "", "", "", "", "", "")
+        for r in failures:
+            table.add_row(*_row_cells(r))
+
+    table.add_row("", "", "", "", "", "", "", "")
+    table.add_row(
+        "",
+        f"queued {batch_info['queued']} · running {len(running)} · "
+        f"[green]ok {batch_info['ok']}[/green] · [red]failed {batch_info['failed']}[/red]",
+        "", "", "", "", "", ""
+    )
+
+    _add_batch_row(table, batch_info)
+    return table
+
+class TableRenderer:
     """
-    Perform remux and update rows[row_idx] and call live.update(build_table(...)) frequently.
-    Returns True/False (success), elapsed_seconds, status_string (for logging).
+    Redraws the Live table from a single thread at a fixed frame rate.
+    Subscribed to a RemuxEngine, whose batched job events (on_events) only mark the table
+    dirty; the table is only rebuilt when something changed (or once per heartbeat), so
+    render cost does not grow with the event rate.
+    In compact mode only running, recently finished and failed rows are drawn; compact=None
+    switches to it once the batch grows past COMPACT_VIEW_THRESHOLD rows.
     """
 
-    # prepare row
-    row = rows[row_idx]
-    row["status_text"] = "Pending"
-    row["pct"] = 0
-    row["elapsed"] = 0.0
-    row["remaining"] = None
-    row["finished"] = False
-    row["success"] = False
-    row["start_time"] = time.time()
-    live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-
-    # skip if exists
-    if skip_if_exists and out_path.exists() and out_path.stat().st_size > 0:
-        row["pct"] = 100
-        row["elapsed"] = 0.0
-        row["remaining"] = 0.0
-        row["finished"] = True
-        row["success"] = True
-        row["status_text"] = "Skipped (exists)"
-        completed_times.append(0.0)
-        live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-        return True, 0.0, "Skipped (exists)"
-
-    # identify tracks
-    ident = identify_tracks(mkvmerge_path, src_path)
-    if not ident["ok"]:
-        row["finished"] = True
-        row["success"] = False
-        row["status_text"] = f"FAILED identify"
-        row["pct"] = 0
-        row["elapsed"] = 0.0
-        row["remaining"] = 0.0
-        live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-        return False, 0.0, f"identify failed: {ident.get('err')}"
-
-    # pick audio & subtitle ids
-    audio_ids = []
-    sub_ids = []
-    for t in ident["data"].get("tracks", []):
-        ttype = (t.get("type") or "").lower()
-        props = t.get("properties") or {}
-        lang = (props.get("language") or "").lower()
-        tid = t.get("id")
-        if ttype == "audio" and isinstance(tid, int) and lang in audio_langs:
-            audio_ids.append(tid)
-        if ttype in ("subtitles", "subtitle") and isinstance(tid, int) and lang in sub_langs:
-            sub_ids.append(tid)
-
-    if not audio_ids:
-        row["finished"] = True
-        row["success"] = False
-        row["status_text"] = "No desired audio"
-        row["pct"] = 0
-        row["elapsed"] = 0.0
-        row["remaining"] = 0.0
-        live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-        return False, 0.0, "no desired audio"
-
-    # build mkvmerge command
-    cmd = [mkvmerge_path, "-o", str(out_path), "--audio-tracks", ",".join(map(str, audio_ids))]
-    if sub_ids:
-        cmd += ["--subtitle-tracks", ",".join(map(str, sub_ids))]
-    else:
-        cmd += ["--no-subtitles"]
-    cmd += ["--ui-language", "en", "--gui-mode", str(src_path)]
-    log_commands.append(" ".join(cmd))
-
-    if dry_run:
-        row["pct"] = 100
-        row["finished"] = True
-        row["success"] = True
-        row["status_text"] = "Dry-run (skipped)"
-        completed_times.append(0.0)
-        live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-        return True, 0.0, "dry-run"
-
-    # spawn mkvmerge
-    try:
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                text=True, bufsize=1, encoding="utf-8", errors="replace")
-    except Exception as e:
-        row["finished"] = True
-        row["success"] = False
-        row["status_text"] = f"Launch failed"
-        row["pct"] = 0
-        row["elapsed"] = 0.0
-        row["remaining"] = 0.0
-        live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-        return False, 0.0, f"launch error: {e}"
-
-    q = queue.Queue()
-    _start_stdout_reader(proc.stdout, q)
-    re_progress = re.compile(r"(?:#GUI#progress|Progress:)\s*([0-9]{1,3})")
-    src_size = src_path.stat().st_size if src_path.exists() else None
-    had_progress = False
-    full_lines = []
-    start = time.time()
-
-    # live update loop
-    while proc.poll() is None or not q.empty():
-        try:
-            line = q.get(timeout=0.25)
-        except queue.Empty:
-            line = None
-
-        if line is not None:
-            full_lines.append(line.rstrip("\n"))
-            m = re_progress.search(line)
-            if m:
-                pct = int(m.group(1))
-                if pct < 0:
-                    pct = 0
-                if pct > 100:
-                    pct = 100
-                had_progress = True
-                row["pct"] = pct
-                now = time.time()
-                row["elapsed"] = now - start
-                if pct > 0:
-                    row["remaining"] = (row["elapsed"] * (100 - pct) / pct)
-                else:
-                    row["remaining"] = None
-                row["status_text"] = "Processing"
-                # update batch row and table
-                live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-        else:
-            # fallback filesize based progress (if mkvmerge doesn't emit progress)
-            if (not had_progress) and out_path.exists() and src_size:
-                try:
-                    cur = out_path.stat().st_size
-                    pct = int(min(99, (cur / src_size) * 100))
-                except Exception:
-                    pct = 0
-                if pct > row["pct"]:
-                    row["pct"] = pct
-                    now = time.time()
-                    row["elapsed"] = now - start
-                    if pct > 0:
-                        row["remaining"] = (row["elapsed"] * (100 - pct) / pct)
-                    else:
-                        row["remaining"] = None
-                    row["status_text"] = "Processing"
-                    live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-
-    rc = proc.wait()
-    elapsed = time.time() - start
-    tail = "\n".join(full_lines[-12:]) if full_lines else ""
-    if rc == 0 and out_path.exists() and out_path.stat().st_size > 0:
-        row["pct"] = 100
-        row["elapsed"] = elapsed
-        row["remaining"] = 0.0
-        row["finished"] = True
-        row["success"] = True
-        row["status_text"] = "OK"
-        completed_times.append(elapsed)
-        live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-        return True, elapsed, "OK"
-    else:
-        # Keep the progress as is, don't reset to 0
-        row["elapsed"] = elapsed
-        row["remaining"] = 0.0
-        row["finished"] = True
-        row["success"] = False
-        reason = f"rc={rc}"
-        if "Error" in tail:
-            row["status_text"] = "FAILED"
+    def __init__(self, live: Live, rows, stats: BatchStats, fps: float = RENDER_FPS, compact: Optional[bool] = False):
+        self.live = live
+        self.rows = rows
+        self.stats = stats
+        self.compact = compact
+        self.interval = 1.0 / fps
+        self.running = {}
+        self.recent = deque(maxlen=RECENT_ROWS)
+        self.failures = deque(maxlen=FAILURE_ROWS)
+        self._done = set()
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def on_events(self, events):
+        """RemuxEngine subscriber: track running, recently finished and failed rows."""
+        with self._lock:
+            for ev in events:
+                if ev["type"] != "job":
+                    continue
+                row = self.rows[ev["key"]]
+                state = ev["job"]
+                if state["finished"]:
+                    self.running.pop(row["no"], None)
+                    if row["no"] not in self._done:
+                        self._done.add(row["no"])
+                        self.recent.append(row)
+                        if not state["success"]:
+                            self.failures.append(row)
+                elif state["start_time"] is not None:
+                    self.running[row["no"]] = row
+        self.mark_dirty()
+
+    def render(self):
+        self._dirty.clear()
+        batch = self.stats.snapshot()
+        compact = self.compact if self.compact is not None else len(self.rows) > COMPACT_VIEW_THRESHOLD
+        if compact:
+            with self._lock:
+                running = list(self.running.values())
+                recent = list(self.recent)
+                failures = list(self.failures)
+            table = build_compact_table(running, recent, failures, batch)
         else:
-            row["status_text"] = f"FAILED (rc={rc})"
-        live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-        return False, elapsed, reason
-
-# ---------- Batch helper ----------
-
-def compute_batch(rows, batch_start, completed_times):
-    total = len(rows)
-    done = sum(1 for r in rows if r.get("finished") and r.get("success"))
-    # batch pct - average of per-file pct
-    avg_pct = int(sum(r.get("pct", 0) for r in rows) / total) if total > 0 else 0
-    elapsed = time.time() - batch_start
-    # estimate remaining: use avg of completed times if available; account for current partial progress
-    remaining = None
-    if len(completed_times) > 0:
-        avg_time = sum(completed_times) / len(completed_times)
-        remaining_files = total - sum(1 for r in rows if r.get("finished"))
-        # estimate for the currently running file's remaining (if any)
-        current_remaining = None
-        for r in rows:
-            if (not r.get("finished")) and r.get("pct", 0) > 0:
-                pct = r["pct"]
-                if pct > 0:
-                    current_elapsed = r.get("elapsed", 0.0)
-                    current_remaining = current_elapsed * (100 - pct) / pct
-                break
-        if current_remaining is None:
-            current_remaining = 0.0
-        remaining = current_remaining + max(0, remaining_files - 1) * avg_time
-    else:
-        # no completed times yet -> try to estimate from current file only
-        current_remaining = None
-        for r in rows:
-            if (not r.get("finished")) and r.get("pct", 0) > 0:
-                pct = r["pct"]
-                if pct > 0:
-                    current_elapsed = r.get("elapsed", 0.0)
-                    current_remaining = current_elapsed * (100 - pct) / pct
-                break
-        remaining = current_remaining
-    return {
-        "pct": avg_pct, 
-        "elapsed": elapsed, 
-        "remaining": remaining, 
-        "done": sum(1 for r in rows if r.get("finished")), 
-        "total": total, 
-        "finished": all(r.get("finished") for r in rows)
-    }
+            table = build_table(self.rows, batch)
+        self.live.update(table, refresh=True)
+
+    def _loop(self):
+        last = 0.0
+        while not self._stop.wait(self.interval):
+            now = time.time()
+            if self._dirty.is_set() or now - last >= RENDER_HEARTBEAT:
+                self.render()
+                last = now
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.render()
 
 # ---------- Main ----------
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch remux MKV files with selected audio and subtitle languages.")
+    parser.add_argument("-i", "--input", help="input directory (skips the interactive prompts)")
+    parser.add_argument("-o", "--output", help="output directory (default: <input>/remuxed)")
+    parser.add_argument("--audio", help="audio languages to keep, e.g. 'eng,jpn' or 'all'; with this set, files "
+                                        "stream from discovery to identify to remux without a language scan")
+    parser.add_argument("--subs", help="subtitle languages to keep, 'all' or 'none' (default with --audio: all)")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="also process .mkv files in subfolders; outputs mirror the folder structure under "
+                             "the output dir")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="skip files and folders whose name or relative path matches this glob pattern, "
+                             "e.g. 'Extras' or '*/sample-*' (repeatable)")
+    parser.add_argument("--follow-symlinks", action="store_true",
+                        help="with --recursive: descend into symlinked folders (each real folder is visited once)")
+    parser.add_argument("--overwrite", action="store_true", help="with --input: remux even if the output exists")
+    parser.add_argument("--dry-run", action="store_true", help="with --input: only log what would be done")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted batch from the journal in the output dir: finished files are "
+                             "left alone, interrupted ones are redone, recorded track lists are reused and, without "
+                             "--audio, so are the languages of that run")
+    parser.add_argument("--metrics", metavar="[HOST:]PORT",
+                        help="serve batch state as JSON (/status) and Prometheus text (/metrics) on this address "
+                             "while the batch runs; a bare port listens on localhost only")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="append a JSONL timing trace to FILE: identify, queue wait, spawn, mux and finalize "
+                             "time plus bytes and mkvmerge warnings of every file")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help=f"number of files to remux in parallel (default: {default_jobs()})")
+    parser.add_argument("--device-jobs", type=int, default=DEFAULT_DEVICE_JOBS,
+                        help="at most this many remuxes read from or write to the same disk at once, e.g. 1 or 2 "
+                             "for spinning disks; jobs on different disks are interleaved either way "
+                             f"(0 = no per-disk limit, default: {DEFAULT_DEVICE_JOBS})")
+    parser.add_argument("--order", choices=ORDER_POLICIES, default="name",
+                        help="order in which files are started: name, largest first (shortest total time with "
+                             "parallel jobs) or smallest first (most files done early) (default: name)")
+    parser.add_argument("--scan-jobs", type=int, default=default_scan_jobs(),
+                        help=f"number of files to identify in parallel while scanning (default: {default_scan_jobs()})")
+    parser.add_argument("--identify-backend", choices=("auto", "mkvmerge"), default="auto",
+                        help="how the language scan identifies files. auto: read Matroska track headers directly "
+                             "and fall back to mkvmerge for unusual files; mkvmerge: always run mkvmerge --identify. "
+                             "Remuxing always uses mkvmerge's track IDs (default: auto)")
+    parser.add_argument("--view", choices=("auto", "full", "compact"), default="auto",
+                        help="full: one table row per file; compact: running, recent and failed files only; "
+                             f"auto: compact for batches over {COMPACT_VIEW_THRESHOLD} files (default: auto)")
+    parser.add_argument("--unchanged", choices=UNCHANGED_MODES, default="copy",
+                        help="what to do with files that already contain only the selected tracks: copy, "
+                             "hard-link or reflink them into the output dir, skip them, or remux them anyway "
+                             "(default: copy; link and reflink fall back to copy)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not read or write the persistent track identification cache")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="empty the track identification cache before scanning")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.device_jobs < 0:
+        parser.error("--device-jobs must not be negative")
+    if args.scan_jobs < 1:
+        parser.error("--scan-jobs must be at least 1")
+    return args
+
 def main():
+    args = parse_args()
     console.print("[bold cyan]=== MKVToolNix batch remux ===[/]")
+    try:
+        metrics_address = parse_address(args.metrics) if args.metrics else None
+    except ValueError as e:
+        console.print(f"[red]{e}[/]")
+        return
 
-    inp = input("Enter input directory path: ").strip().strip('"')
+    inp = args.input or input("Enter input directory path: ").strip().strip('"')
     if not inp:
         console.print("[red]Input directory required.[/]")
         return
@@ -455,112 +398,151 @@ def main():
         console.print(f"[red]Directory not found: {input_dir}[/]")
         return
 
-    outp = input("Enter output directory path (blank = remuxed): ").strip().strip('"')
+    if args.input:
+        # unattended: everything else comes from flags
+        outp = args.output or ""
+        skip_if_exists = not args.overwrite
+        dry_run = args.dry_run
+    else:
+        outp = args.output or input("Enter output directory path (blank = remuxed): ").strip().strip('"')
     output_dir = Path(outp) if outp else input_dir / "remuxed"
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    skip_if_exists = (input("Skip files if output exists? (Y/n) [Y]: ").strip().lower() != "n")
-    dry_run = (input("Dry-run only? (y/N) [N]: ").strip().lower() == "y")
+    def discover():
+        # the output dir is skipped so earlier results inside the input tree are not picked up again
+        return iter_mkv_files(input_dir, args.recursive, args.exclude, args.follow_symlinks, skip_dirs=[output_dir])
+
+    def rel_name(src):
+        return src.relative_to(input_dir).as_posix()
+
+    if not args.input:
+        skip_if_exists = (input("Skip files if output exists? (Y/n) [Y]: ").strip().lower() != "n")
+        dry_run = (input("Dry-run only? (y/N) [N]: ").strip().lower() == "y")
 
     mkvmerge_path = find_mkvmerge()
     if not mkvmerge_path:
         console.print("[red]✗ mkvmerge not found on PATH. Install MKVToolNix or add mkvmerge to PATH.[/]")
         return
 
-    # collect mkv files
-    mkv_files = sorted(input_dir.glob("*.mkv"))
-    total = len(mkv_files)
-    if total == 0:
-        console.print("[yellow]No .mkv files found in the input directory.[/]")
-        return
+    cache = None if args.no_cache else IdentifyCache.open_default()
+    if cache is not None and args.clear_cache:
+        cache.clear()
+
+    # per-file progress journal; a dry run writes nothing worth resuming
+    journal = JobJournal.open_in(output_dir, resume=True) if args.resume and not dry_run else None
+    audio_arg, subs_arg = args.audio, args.subs
+    if audio_arg is None and journal is not None and journal.run is not None:
+        audio_arg = ",".join(journal.run.get("audio") or [])
+        subs_arg = ",".join(journal.run.get("subs") or []) or "none"
+        console.print(f"Resuming with audio: {audio_arg}, subtitles: {subs_arg}")
+
+    # with languages given up front, files stream through identify and remux as they are found
+    streaming = audio_arg is not None
+
+    if streaming:
+        audio_langs = parse_lang_list(audio_arg)
+        sub_langs = parse_lang_list(subs_arg) if subs_arg is not None else [ALL_LANGS]
+        if not audio_langs:
+            console.print("[red]At least one audio language must be selected.[/]")
+            return
+        mkv_files = []
+        tracks_by_file = {}
+        console.print(f"Streaming MKV files from: {input_dir}\n")
+    else:
+        # collect mkv files
+        mkv_files = sorted(discover(), key=rel_name)
+        if not mkv_files:
+            console.print("[yellow]No .mkv files found in the input directory.[/]")
+            return
 
-    console.print(f"Found {total} MKV file(s) in: {input_dir}\n")
+        console.print(f"Found {len(mkv_files)} MKV file(s) in: {input_dir}\n")
 
-    # Scan files for available languages
-    audio_langs_available, sub_langs_available = get_available_languages(mkvmerge_path, mkv_files)
-    
-    if not audio_langs_available:
-        console.print("[red]No audio tracks found in any file. Cannot proceed.[/]")
-        return
-    
-    # Prompt user for language selection
-    audio_langs, sub_langs = prompt_language_selection(audio_langs_available, sub_langs_available)
-    
-    if not audio_langs:
-        console.print("[red]At least one audio language must be selected.[/]")
-        return
+        # Scan files for available languages
+        audio_langs_available, sub_langs_available, tracks_by_file = get_available_languages(
+            mkvmerge_path, mkv_files, cache, args.scan_jobs, args.identify_backend)
+        
+        if not audio_langs_available:
+            console.print("[red]No audio tracks found in any file. Cannot proceed.[/]")
+            return
+        
+        # Prompt user for language selection
+        audio_langs, sub_langs = prompt_language_selection(audio_langs_available, sub_langs_available)
+        
+        if not audio_langs:
+            console.print("[red]At least one audio language must be selected.[/]")
+            return
 
-    # prepare rows
-    rows = []
-    for i, f in enumerate(mkv_files, start=1):
-        rows.append({
-            "no": i,
-            "fullname": f.name,
-            "display_name": shorten(f.name, 40),
-            "pct": 0,
-            "elapsed": 0.0,
-            "remaining": None,
-            "status_text": "Pending",
-            "finished": False,
-            "success": False,
-            "start_time": None
-        })
+    metrics = None
+    if metrics_address is not None:
+        try:
+            metrics = MetricsServer(*metrics_address)
+        except OSError as e:
+            console.print(f"[red]Cannot serve metrics on {args.metrics}: {e}[/]")
+            return
+        console.print(f"[cyan]Metrics:[/] {metrics.url}/metrics  (JSON: {metrics.url}/status)")
+
+    if journal is None and not dry_run:
+        # started afresh only now, so giving up at a prompt keeps an interrupted run resumable
+        journal = JobJournal.open_in(output_dir)
+
+    options = RemuxOptions(
+        output_dir=output_dir, audio_langs=audio_langs, sub_langs=sub_langs, input_dir=input_dir,
+        skip_if_exists=skip_if_exists, dry_run=dry_run, unchanged=args.unchanged, jobs=args.jobs,
+        device_jobs=args.device_jobs, order=args.order, scan_jobs=args.scan_jobs)
+    throughput = ThroughputModel.open_default()
+    trace = TraceWriter(Path(args.trace)) if args.trace else None
+    engine = RemuxEngine(mkvmerge_path, options, cache, throughput, journal, trace)
+    if metrics is not None:
+        metrics.attach(engine, input=str(input_dir), output=str(output_dir))
+    rows = engine.jobs
 
     log_path = output_dir / "remux_log.txt"
-    with open(log_path, "a", encoding="utf-8") as lf:
-        lf.write(f"==== remux run: {time.strftime('%Y-%m-%d %H:%M:%S')} ====\n")
-        lf.write(f"Input dir: {input_dir}\nOutput dir: {output_dir}\nFiles: {total}\n")
-        lf.write(f"Audio languages: {', '.join(audio_langs)}\nSubtitle languages: {', '.join(sub_langs)}\n\n")
-
-    # store executed commands for debug (optional)
-    log_commands = []
-
-    # run live table
-    batch_start = time.time()
-    completed_times = []
-
-    with Live(build_table(rows, compute_batch(rows, batch_start, completed_times)), refresh_per_second=8, console=console) as live:
-        for idx, src in enumerate(mkv_files):
-            out_file = output_dir / src.name
-            ok, elapsed, reason = remux_file_and_update(
-                mkvmerge_path, src, out_file, idx, rows, live, batch_start, completed_times, log_commands,
-                skip_if_exists, dry_run, audio_langs, sub_langs
-            )
-            # status already updated inside function; ensure last render
-            live.update(build_table(rows, compute_batch(rows, batch_start, completed_times)))
-
-    # write final plain-text summary table to log
-    final_lines = []
-    final_lines.append("SL No.\tFilename\tProgress\tElapsed\tRemaining\tStatus\tResult")
-    ok_count = 0
-    fail_count = 0
-    for r in rows:
-        status_text = r.get("status_text", "")
-        result_text = ""
-        if r.get("success"):
-            ok_count += 1
-            result_text = "OK"
-        elif r.get("finished") and not r.get("success"):
-            fail_count += 1
-            result_text = "FAILED"
-        final_lines.append(
-            f"{r['no']}\t{r['fullname']}\t{int(r.get('pct',0))}%\t"
-            f"{fmt_time(r.get('elapsed'))}\t{fmt_time(r.get('remaining')) if r.get('remaining') is not None else '--:--'}\t"
-            f"{status_text}\t{result_text}"
-        )
-
-    total_elapsed = time.time() - batch_start
-
-    with open(log_path, "a", encoding="utf-8") as lf:
-        lf.write("\n".join(final_lines) + "\n\n")
-        lf.write(f"=== Summary ===\nProcessed: {total}, OK: {ok_count}, Failed: {fail_count}\nTotal time: {fmt_time(total_elapsed)}\n")
-        if log_commands:
-            lf.write("\nCommands executed (sample):\n")
-            for c in log_commands[:10]:
-                lf.write(c + "\n")
-        lf.write("\n")
-
-    console.print(f"\n[green]Completed: {ok_count} OK, {fail_count} failed. Log saved to:[/] {log_path}")
+    engine.write_log_header(log_path, f"{input_dir}{' (recursive)' if args.recursive else ''}")
+
+    compact = {"full": False, "compact": True, "auto": None}[args.view]
+
+    interrupted = False
+    try:
+        with Live(console=console, auto_refresh=False) as live:
+            # the renderer draws the first frame within one tick and a final frame on exit
+            with TableRenderer(live, rows, engine.stats, compact=compact) as ui:
+                engine.subscribe(ui.on_events)
+                # leaving the engine waits for every file; on Ctrl+C it first drops queued files and
+                # kills running mkvmerge processes instead of orphaning them
+                with engine:
+                    for src in (discover() if streaming else mkv_files):
+                        engine.add(src, tracks_by_file.get(src))
+    except KeyboardInterrupt:
+        # the engine has already cancelled the rest; still write the log and save state below
+        interrupted = True
+    finally:
+        # write final plain-text summary table to log
+        engine.write_log_summary(log_path)
+        if cache is not None:
+            cache.close()
+        if journal is not None:
+            journal.close()
+        if trace is not None:
+            trace.close()
+        if metrics is not None:
+            metrics.close()
+        throughput.save()
+
+    if interrupted:
+        console.print(f"\n[yellow]Interrupted: {engine.stats.ok} OK, {engine.stats.failed} failed or cancelled. "
+                      f"Log saved to:[/] {log_path}")
+        if journal is not None:
+            console.print("[yellow]Run the same command with --resume to continue.[/]")
+        sys.exit(130)
+
+    if streaming and not rows:
+        console.print("[yellow]No .mkv files found in the input directory.[/]")
+
+    unchanged_count, bytes_saved = engine.unchanged_totals()
+    console.print(f"\n[green]Completed: {engine.stats.ok} OK, {engine.stats.failed} failed. Log saved to:[/] {log_path}")
+    if unchanged_count:
+        console.print(f"[green]{unchanged_count} file(s) already matched the selection and were not remuxed "
+                      f"({fmt_size(bytes_saved)} saved).[/]")
 
 if __name__ == "__main__":
     main()
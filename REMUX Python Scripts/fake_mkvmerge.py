@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+fake_mkvmerge.py
+Stand-in for mkvmerge used by remux_bench: answers --version and --identify and "remuxes" by
+printing #GUI#progress lines at a steady rate while growing a synthetic output, so the scripts'
+own overhead can be measured without MKVToolNix or real media. make_source() writes .mkv
+sources with a real Matroska track header (readable by mkv_ebml) followed by sparse padding.
+
+Behaviour is set through environment variables:
+    FAKE_MKVMERGE_IDENTIFY_DELAY   seconds an --identify call takes (default 0)
+    FAKE_MKVMERGE_DURATION         seconds a remux takes (default 0.2)
+    FAKE_MKVMERGE_PROGRESS_LINES   #GUI#progress lines per remux (default 20)
+    FAKE_MKVMERGE_WARNINGS         "#GUI#warning" lines per remux (default 0)
+    FAKE_MKVMERGE_WRITE            sparse (default): outputs are grown with truncate();
+                                   full: every byte is written, for disk-bound runs
+    FAKE_MKVMERGE_FAIL             sources whose name contains this fail with rc 2
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from mkv_ebml import (CODEC_ID, DOC_TYPE, EBML_HEADER, LANGUAGE, SEGMENT, TRACK_ENTRY, TRACK_NUMBER, TRACK_TYPE,
+                      TRACK_UID, TRACKS, read_tracks)
+
+VERSION = "mkvmerge v80.0 ('Fake Stand-in') 64-bit"
+# all value bits set: a Segment of unknown size
+UNKNOWN_SIZE = b"\x01\xff\xff\xff\xff\xff\xff\xff"
+CHUNK = 1 << 20
+
+
+def _element(el_id: int, payload: bytes) -> bytes:
+    # IDs keep their marker bits; sizes always use the 8-byte form
+    return el_id.to_bytes((el_id.bit_length() + 7) // 8, "big") + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def _uint(el_id: int, value: int) -> bytes:
+    return _element(el_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big"))
+
+
+def _track(number: int, ttype: int, codec: str, lang: str) -> bytes:
+    return _element(TRACK_ENTRY, _uint(TRACK_NUMBER, number) + _uint(TRACK_UID, number * 7919)
+                    + _uint(TRACK_TYPE, ttype) + _element(CODEC_ID, codec.encode("ascii"))
+                    + _element(LANGUAGE, lang.encode("ascii")))
+
+
+def matroska_header(audio_langs=("eng",), sub_langs=("eng",)) -> bytes:
+    """EBML header, Segment start and a Tracks element with one video and the given audio/subtitle tracks."""
+    tracks = [(1, "V_MPEG4/ISO/AVC", "und")]
+    tracks += [(2, "A_AAC", lang) for lang in audio_langs]
+    tracks += [(17, "S_TEXT/UTF8", lang) for lang in sub_langs]
+    entries = b"".join(_track(n, ttype, codec, lang) for n, (ttype, codec, lang) in enumerate(tracks, 1))
+    return (_element(EBML_HEADER, _element(DOC_TYPE, b"matroska")) + SEGMENT.to_bytes(4, "big") + UNKNOWN_SIZE
+            + _element(TRACKS, entries))
+
+
+def make_source(path: Path, size: int, audio_langs=("eng",), sub_langs=("eng",)):
+    """Write a synthetic source of `size` bytes (sparse where the filesystem allows)."""
+    header = matroska_header(audio_langs, sub_langs)
+    with open(str(path), "wb") as f:
+        f.write(header)
+        f.truncate(max(size, len(header)))
+
+
+def _env(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _identify(src: str) -> int:
+    time.sleep(_env("FAKE_MKVMERGE_IDENTIFY_DELAY", 0.0))
+    data = read_tracks(Path(src))
+    if data is None:
+        print(f"Error: The file '{src}' could not be opened for reading.")
+        return 2
+    print(json.dumps(dict(data, container={"type": "Matroska", "recognized": True, "supported": True})))
+    return 0
+
+
+def _remux(out: str, src: str) -> int:
+    fail = os.environ.get("FAKE_MKVMERGE_FAIL")
+    if fail and fail in os.path.basename(src):
+        print(f"Error: The file '{src}' is broken.", flush=True)
+        return 2
+    size = os.path.getsize(src)
+    lines = max(1, int(_env("FAKE_MKVMERGE_PROGRESS_LINES", 20)))
+    step = _env("FAKE_MKVMERGE_DURATION", 0.2) / lines
+    full = os.environ.get("FAKE_MKVMERGE_WRITE") == "full"
+    for _ in range(int(_env("FAKE_MKVMERGE_WARNINGS", 0))):
+        print("#GUI#warning Fake stand-in warning.", flush=True)
+    with open(src, "rb") as s, open(out, "wb") as f:
+        f.write(s.read(4096))
+        for i in range(1, lines + 1):
+            target = size * i // lines
+            if full:
+                while f.tell() < target:
+                    f.write(bytes(min(CHUNK, target - f.tell())))
+            else:
+                f.truncate(target)
+            time.sleep(step)
+            print(f"#GUI#progress {100 * i // lines}%", flush=True)
+    return 0
+
+
+def main(argv) -> int:
+    if "--version" in argv:
+        print(VERSION)
+        return 0
+    if "--identify" in argv or "-J" in argv:
+        return _identify(argv[-1])
+    if "-o" in argv:
+        return _remux(argv[argv.index("-o") + 1], argv[-1])
+    print("Error: no output file name was given.")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+mkv_ebml.py
+Minimal Matroska/EBML track header reader used as a fast identify backend.
+Only the EBML header, the SeekHead and the Tracks element are read (a few KB via seek),
+never the clusters. read_tracks() returns the subset of the
+`mkvmerge --identify --identification-format json` structure the remux scripts use,
+or None for anything unusual so callers can fall back to mkvmerge.
+"""
+
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# EBML / Matroska element IDs (marker bits included)
+EBML_HEADER = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+TRACKS = 0x1654AE6B
+CLUSTER = 0x1F43B675
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+NAME = 0x536E
+LANGUAGE = 0x22B59C
+LANGUAGE_BCP47 = 0x22B59D
+FLAG_DEFAULT = 0x88
+FLAG_ENABLED = 0xB9
+FLAG_FORCED = 0x55AA
+
+TRACK_TYPES = {1: "video", 2: "audio", 17: "subtitles"}
+
+MAX_HEADER_SIZE = 4096
+MAX_TRACKS_SIZE = 16 * 1024 * 1024
+MAX_TOP_LEVEL_ELEMENTS = 32
+
+
+class _Unsupported(Exception):
+    """Raised for valid-but-unusual files; the caller falls back to mkvmerge."""
+
+
+def _read_vint(data: bytes, pos: int, is_id: bool) -> Tuple[int, int, bool]:
+    """Decode an EBML variable-size integer at data[pos]. Returns (value, new_pos, unknown_size)."""
+    if pos >= len(data):
+        raise _Unsupported("truncated element")
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > (4 if is_id else 8) or pos + length > len(data):
+        raise _Unsupported("bad vint")
+    value = first if is_id else first & (mask - 1)
+    for b in data[pos + 1:pos + length]:
+        value = (value << 8) | b
+    unknown = (not is_id) and value == (1 << (7 * length)) - 1
+    return value, pos + length, unknown
+
+
+def _read_element_header(f: BinaryIO) -> Tuple[int, Optional[int]]:
+    """Read an element header from the file; size is None for unknown-size elements."""
+    head = f.read(12)
+    el_id, pos, _ = _read_vint(head, 0, is_id=True)
+    size, pos, unknown = _read_vint(head, pos, is_id=False)
+    f.seek(pos - len(head), os.SEEK_CUR)
+    return el_id, (None if unknown else size)
+
+
+def _children(data: bytes) -> Iterator[Tuple[int, bytes]]:
+    """Iterate (id, payload) over the child elements of a fully read master element."""
+    pos = 0
+    while pos < len(data):
+        el_id, pos, _ = _read_vint(data, pos, is_id=True)
+        size, pos, unknown = _read_vint(data, pos, is_id=False)
+        if unknown or pos + size > len(data):
+            raise _Unsupported("child element overruns its parent")
+        yield el_id, data[pos:pos + size]
+        pos += size
+
+
+def _uint(payload: bytes) -> int:
+    return int.from_bytes(payload, "big") if payload else 0
+
+
+def _string(payload: bytes) -> str:
+    return payload.split(b"\0", 1)[0].decode("utf-8")
+
+
+def _read_payload(f: BinaryIO, size: Optional[int], limit: int) -> bytes:
+    if size is None or size > limit:
+        raise _Unsupported("element too large or of unknown size")
+    data = f.read(size)
+    if len(data) != size:
+        raise _Unsupported("truncated file")
+    return data
+
+
+def _parse_track_entry(data: bytes) -> dict:
+    entry = {"language": "eng", "default": 1, "enabled": 1, "forced": 0}
+    for el_id, payload in _children(data):
+        if el_id == TRACK_NUMBER:
+            entry["number"] = _uint(payload)
+        elif el_id == TRACK_UID:
+            entry["uid"] = _uint(payload)
+        elif el_id == TRACK_TYPE:
+            entry["type"] = _uint(payload)
+        elif el_id == CODEC_ID:
+            entry["codec_id"] = _string(payload)
+        elif el_id == NAME:
+            entry["name"] = _string(payload)
+        elif el_id == LANGUAGE:
+            entry["language"] = _string(payload) or "eng"
+            entry["has_language"] = True
+        elif el_id == LANGUAGE_BCP47:
+            entry["language_ietf"] = _string(payload)
+        elif el_id == FLAG_DEFAULT:
+            entry["default"] = _uint(payload)
+        elif el_id == FLAG_ENABLED:
+            entry["enabled"] = _uint(payload)
+        elif el_id == FLAG_FORCED:
+            entry["forced"] = _uint(payload)
+    return entry
+
+
+def _parse_tracks(data: bytes) -> dict:
+    tracks = []
+    seen_numbers = set()
+    for el_id, payload in _children(data):
+        if el_id != TRACK_ENTRY:
+            continue
+        entry = _parse_track_entry(payload)
+        number = entry.get("number")
+        ttype = TRACK_TYPES.get(entry.get("type"))
+        if not number or ttype is None or number in seen_numbers:
+            raise _Unsupported("track without number, duplicate number or unsupported type")
+        if "language_ietf" in entry and not entry.get("has_language"):
+            # mkvmerge derives the legacy code from the IETF tag; leave that mapping to it
+            raise _Unsupported("IETF-only language")
+        seen_numbers.add(number)
+        props = {
+            "number": number,
+            "language": entry["language"].lower(),
+            "default_track": bool(entry["default"]),
+            "enabled_track": bool(entry["enabled"]),
+            "forced_track": bool(entry["forced"]),
+        }
+        if "uid" in entry:
+            props["uid"] = entry["uid"]
+        if "codec_id" in entry:
+            props["codec_id"] = entry["codec_id"]
+        if "name" in entry:
+            props["track_name"] = entry["name"]
+        if "language_ietf" in entry:
+            props["language_ietf"] = entry["language_ietf"]
+        # mkvmerge numbers Matroska tracks in TrackEntry order, starting at 0
+        tracks.append({"id": len(tracks), "type": ttype, "codec": entry.get("codec_id", ""), "properties": props})
+    if not tracks:
+        raise _Unsupported("no tracks")
+    return {"tracks": tracks}
+
+
+def _find_tracks_offset(seek_head: bytes, segment_start: int) -> Optional[int]:
+    for el_id, payload in _children(seek_head):
+        if el_id != SEEK:
+            continue
+        target = None
+        position = None
+        for child_id, child in _children(payload):
+            if child_id == SEEK_ID:
+                target = _uint(child)
+            elif child_id == SEEK_POSITION:
+                position = _uint(child)
+        if target == TRACKS and position is not None:
+            return segment_start + position
+    return None
+
+
+def _read(f: BinaryIO) -> dict:
+    el_id, size = _read_element_header(f)
+    if el_id != EBML_HEADER:
+        raise _Unsupported("not an EBML file")
+    header = _read_payload(f, size, MAX_HEADER_SIZE)
+    doc_type = ""
+    for child_id, payload in _children(header):
+        if child_id == DOC_TYPE:
+            doc_type = _string(payload)
+    if doc_type not in ("matroska", "webm"):
+        raise _Unsupported("unknown DocType")
+
+    el_id, _ = _read_element_header(f)
+    if el_id != SEGMENT:
+        raise _Unsupported("Segment does not follow the EBML header")
+    segment_start = f.tell()
+
+    for _ in range(MAX_TOP_LEVEL_ELEMENTS):
+        el_id, size = _read_element_header(f)
+        if el_id == TRACKS:
+            return _parse_tracks(_read_payload(f, size, MAX_TRACKS_SIZE))
+        if el_id == SEEK_HEAD:
+            offset = _find_tracks_offset(_read_payload(f, size, MAX_TRACKS_SIZE), segment_start)
+            if offset is not None:
+                f.seek(offset)
+                el_id, size = _read_element_header(f)
+                if el_id != TRACKS:
+                    raise _Unsupported("SeekHead points at the wrong element")
+                return _parse_tracks(_read_payload(f, size, MAX_TRACKS_SIZE))
+            continue
+        if el_id == CLUSTER or size is None:
+            raise _Unsupported("reached media data before Tracks")
+        f.seek(size, os.SEEK_CUR)
+    raise _Unsupported("Tracks not found near the start of the Segment")
+
+
+def read_tracks(path: Path) -> Optional[dict]:
+    """Return {"tracks": [...]} in mkvmerge's identify layout, or None if the file needs mkvmerge."""
+    try:
+        with open(str(path), "rb") as f:
+            return _read(f)
+    except (_Unsupported, OSError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+remux_bench.py
+Benchmarks of the scripts' own overhead, run against fake_mkvmerge instead of MKVToolNix and
+synthetic sources instead of real media, so they work on any machine and a change that makes
+scanning, scheduling or drawing slower shows up before it reaches a real library.
+
+Suites:
+    scan    the language scan (get_available_languages) with the header and mkvmerge backends
+    render  one CLI table frame (full and compact view) and one BatchStats.snapshot() at N files
+    batch   whole batches through RemuxEngine at each --jobs level: wall-clock time, CPU of this
+            process and of the mkvmerge stand-ins, overhead per file over the ideal schedule,
+            engine events and the time the frontend (--ui: none, cli table or gui
+            process_queue) spends handling them
+
+Every result holds timings in seconds under "metrics". --save writes them as JSON; --baseline
+compares with such a file and exits with 1 when a timing got worse by more than --tolerance.
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import queue
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_mkvmerge import make_source
+from remux_engine import (RemuxEngine, RemuxOptions, default_scan_jobs, get_available_languages, mkvmerge_version,
+                          new_job)
+from remux_journal import JobJournal
+from remux_stats import BatchStats, ThroughputModel
+
+SUITES = ("scan", "render", "batch")
+UIS = ("none", "cli", "gui")
+# a timing only counts as a regression if it is also this many seconds worse
+MIN_REGRESSION = 0.005
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text: str) -> int:
+    """'500K', '1M', '4G' or a byte count."""
+    text = text.strip().upper().rstrip("B")
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * SIZE_UNITS[unit])
+
+
+def parse_int_list(text: str) -> list:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+class Clock:
+    """Wall-clock and CPU time of a block; children are the mkvmerge stand-ins reaped in it."""
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self._cpu0 = os.times()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        cpu = os.times()
+        self.wall = time.perf_counter() - self._t0
+        self.cpu = (cpu.user - self._cpu0.user) + (cpu.system - self._cpu0.system)
+        self.cpu_children = ((cpu.children_user - self._cpu0.children_user)
+                             + (cpu.children_system - self._cpu0.children_system))
+        return False
+
+
+class Timed:
+    """Wraps a callable and adds up the time spent in it."""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - t0
+            self.calls += 1
+
+
+class EventCounter:
+    """RemuxEngine subscriber counting events (and the job updates inside them)."""
+
+    def __init__(self):
+        self.batches = 0
+        self.events = 0
+
+    def __call__(self, events):
+        self.batches += 1
+        self.events += len(events)
+
+
+def _record(suite: str, metrics: dict, **params) -> dict:
+    rid = "/".join([suite] + [f"{k}={v}" for k, v in params.items() if k not in ("info",)])
+    info = params.pop("info", {})
+    return {"id": rid, "suite": suite, "params": params, "metrics": metrics, "info": info}
+
+
+def install_fake(workdir: Path) -> str:
+    """Put an `mkvmerge` that runs fake_mkvmerge.py first on PATH; returns its path."""
+    bin_dir = workdir / "bin"
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    fake = Path(__file__).resolve().with_name("fake_mkvmerge.py")
+    if os.name == "nt":
+        wrapper = bin_dir / "mkvmerge.cmd"
+        wrapper.write_text(f'@"{sys.executable}" "{fake}" %*\n', encoding="utf-8")
+    else:
+        wrapper = bin_dir / "mkvmerge"
+        wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{fake}" "$@"\n', encoding="utf-8")
+        wrapper.chmod(0o755)
+    os.environ["PATH"] = str(bin_dir) + os.pathsep + os.environ.get("PATH", "")
+    return str(wrapper)
+
+
+def make_sources(folder: Path, count: int, size: int, audio: list, subs: list) -> list:
+    folder.mkdir(parents=True, exist_ok=True)
+    files = []
+    for i in range(count):
+        path = folder / f"file{i:05d}.mkv"
+        if not path.exists():
+            make_source(path, size, audio, subs)
+        files.append(path)
+    return files
+
+
+# ---------- Suites ----------
+
+def bench_scan(mkvmerge_path: str, files: list, args) -> list:
+    records = []
+    for backend in ("auto", "mkvmerge"):
+        with Clock() as c:
+            _, _, found = get_available_languages(mkvmerge_path, files, cache=None, jobs=args.scan_jobs,
+                                                  backend=backend)
+        records.append(_record(
+            "scan", {"wall": c.wall, "cpu": c.cpu, "cpu_children": c.cpu_children}, backend=backend,
+            files=len(files), info={"identified": len(found), "files_per_sec": len(files) / c.wall if c.wall else None}))
+    return records
+
+
+def _synthetic_rows(count: int, jobs: int):
+    # a batch caught mid-way: half finished (a few failed), `jobs` running, the rest queued
+    rows = [new_job(i, Path(f"file{i:05d}.mkv"), f"Season {i // 20 + 1:02d}/file{i:05d}.mkv") for i in range(count)]
+    stats = BatchStats(count, jobs)
+    for r in rows:
+        stats.register(r["key"], 1 << 30, 1)
+    done = count // 2
+    for r in rows[:done]:
+        ok = r["key"] % 50 != 49
+        r.update(pct=100 if ok else 40, elapsed=30.0, remaining=0.0, finished=True, success=ok,
+                 status_text="OK" if ok else "FAILED", start_time=time.time() - 60)
+        stats.finish(r["key"], ok, r["pct"], 30.0 if ok else None)
+    running = rows[done:done + jobs]
+    for r in running:
+        r.update(pct=50, elapsed=15.0, remaining=15.0, status_text="Processing", start_time=time.time() - 15)
+        stats.progress(r["key"], 50, 15.0)
+    recent = rows[max(0, done - 8):done]
+    failures = [r for r in rows[:done] if not r["success"]][-10:]
+    return rows, stats, running, recent, failures
+
+
+def bench_render(count: int, args) -> list:
+    from rich.console import Console
+    from REMUX_Script import build_compact_table, build_table
+
+    jobs = max(args.jobs)
+    rows, stats, running, recent, failures = _synthetic_rows(count, jobs)
+    console = Console(file=io.StringIO(), width=150, force_terminal=True, color_system="truecolor")
+
+    def frame(build):
+        console.file = io.StringIO()
+        console.print(build())
+
+    timings = {
+        "snapshot": lambda: stats.snapshot(),
+        "full_frame": lambda: frame(lambda: build_table(rows, stats.snapshot())),
+        "compact_frame": lambda: frame(lambda: build_compact_table(running, recent, failures, stats.snapshot())),
+    }
+    metrics = {}
+    for name, fn in timings.items():
+        samples = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+        metrics[name] = statistics.median(samples)
+    return [_record("render", metrics, files=count)]
+
+
+def _options(workdir: Path, files: list, jobs: int, args) -> RemuxOptions:
+    out = workdir / f"out-{len(files)}-{jobs}"
+    shutil.rmtree(str(out), ignore_errors=True)
+    out.mkdir(parents=True)
+    return RemuxOptions(
+        output_dir=out, audio_langs=["eng"], sub_langs=["eng"], input_dir=files[0].parent, skip_if_exists=False,
+        unchanged="remux", jobs=jobs, device_jobs=args.device_jobs, scan_jobs=args.scan_jobs)
+
+
+def _run_engine(mkvmerge_path: str, files: list, options: RemuxOptions, ui: str):
+    """Batch through RemuxEngine with no frontend or the CLI's table renderer; returns (counter, UI seconds)."""
+    counter = EventCounter()
+    journal = JobJournal.open_in(options.output_dir)
+    engine = RemuxEngine(mkvmerge_path, options, None, ThroughputModel(None), journal)
+    engine.subscribe(counter)
+    if ui == "none":
+        with engine:
+            for src in files:
+                engine.add(src)
+        journal.close()
+        return counter, 0.0
+
+    from rich.console import Console
+    from rich.live import Live
+    from REMUX_Script import TableRenderer
+
+    console = Console(file=io.StringIO(), width=150, force_terminal=True, color_system="truecolor")
+    with Live(console=console, auto_refresh=False) as live:
+        renderer = TableRenderer(live, engine.jobs, engine.stats, compact=None)
+        on_events = Timed(renderer.on_events)
+        renderer.render = render = Timed(renderer.render)
+        with renderer:
+            engine.subscribe(on_events)
+            with engine:
+                for src in files:
+                    engine.add(src)
+    journal.close()
+    return counter, on_events.seconds + render.seconds
+
+
+class _CountingQueue(queue.Queue):
+    def __init__(self, counter: EventCounter):
+        super().__init__()
+        self.counter = counter
+
+    def put(self, item, block=True, timeout=None):
+        self.counter(item)
+        super().put(item, block, timeout)
+
+
+def _run_gui(files: list, options: RemuxOptions):
+    """Batch through the GUI's start_remux and process_queue on a withdrawn Tk window."""
+    import tkinter as tk
+    import REMUX_GUI
+
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        app = REMUX_GUI.RemuxApp(root)
+        # keep the user's identify cache and throughput history out of it
+        app.identify_cache = None
+        app.throughput = ThroughputModel(None)
+        counter = EventCounter()
+        app.update_queue = _CountingQueue(counter)
+        app.process_queue = process_queue = Timed(app.process_queue)
+        app.input_dir.set(str(options.input_dir))
+        app.output_dir.set(str(options.output_dir))
+        app.audio_langs.set(",".join(options.audio_langs))
+        app.sub_langs.set(",".join(options.sub_langs))
+        app.jobs.set(options.jobs)
+        app.device_jobs.set(options.device_jobs)
+        app.skip_exists.set(False)
+        app.dry_run.set(False)
+        app.unchanged_mode.set(dict((mode, label) for label, mode in REMUX_GUI.UNCHANGED_CHOICES)["remux"])
+        app.fast_scan.set(True)
+        app.start_remux()
+        while app.running:
+            root.update()
+            time.sleep(0.005)
+        app.worker_thread.join()
+        return counter, process_queue.seconds
+    finally:
+        root.destroy()
+
+
+def bench_batch(mkvmerge_path: str, files: list, jobs: int, ui: str, workdir: Path, args) -> dict:
+    options = _options(workdir, files, jobs, args)
+    with Clock() as c:
+        if ui == "gui":
+            counter, ui_seconds = _run_gui(files, options)
+        else:
+            counter, ui_seconds = _run_engine(mkvmerge_path, files, options, ui)
+    # every file takes the stand-in's duration; anything above that is spawn and orchestration cost
+    ideal = math.ceil(len(files) / jobs) * args.duration
+    metrics = {"wall": c.wall, "cpu": c.cpu, "cpu_children": c.cpu_children,
+               "overhead_per_file": max(0.0, c.wall - ideal) * jobs / len(files)}
+    if ui != "none":
+        metrics["ui"] = ui_seconds
+        metrics["ui_per_event"] = ui_seconds / counter.events if counter.events else 0.0
+    return _record("batch", metrics, ui=ui, files=len(files), jobs=jobs,
+                   info={"events": counter.events, "event_batches": counter.batches,
+                         "files_per_sec": len(files) / c.wall if c.wall else None})
+
+
+def _gui_available() -> bool:
+    try:
+        import tkinter as tk
+        tk.Tk().destroy()
+        return True
+    except Exception:
+        return False
+
+
+# ---------- Reporting ----------
+
+def _fmt(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds * 1e6:.0f}us"
+
+
+def print_record(rec: dict):
+    metrics = "  ".join(f"{k}={_fmt(v)}" for k, v in rec["metrics"].items())
+    info = "  ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in rec["info"].items()
+                     if v is not None)
+    print(f"{rec['id']:<40} {metrics}  {info}".rstrip(), flush=True)
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Regressions as (id, metric, old seconds, new seconds)."""
+    old = {rec["id"]: rec["metrics"] for rec in baseline}
+    regressions = []
+    for rec in results:
+        for name, value in rec["metrics"].items():
+            before = old.get(rec["id"], {}).get(name)
+            if before is not None and value > before * (1 + tolerance) and value - before > MIN_REGRESSION:
+                regressions.append((rec["id"], name, before, value))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure scan, render and batch overhead against a fake mkvmerge and synthetic sources.")
+    parser.add_argument("--suite", action="append", choices=SUITES,
+                        help="suite to run (repeatable, default: all)")
+    parser.add_argument("--files", type=parse_int_list, default=[10, 100, 1000],
+                        help="comma-separated batch sizes (default: 10,100,1000)")
+    parser.add_argument("--jobs", type=parse_int_list, default=[1, 4, 16],
+                        help="comma-separated parallel job counts for the batch suite (default: 1,4,16)")
+    parser.add_argument("--ui", default="none,cli",
+                        help="comma-separated frontends for the batch suite: none, cli, gui (default: none,cli; "
+                             "gui needs a display)")
+    parser.add_argument("--duration", type=float, default=0.05,
+                        help="seconds the stand-in takes per remux (default: 0.05)")
+    parser.add_argument("--progress-lines", type=int, default=20,
+                        help="progress lines the stand-in prints per remux (default: 20)")
+    parser.add_argument("--identify-delay", type=float, default=0.0,
+                        help="seconds the stand-in takes per --identify (default: 0)")
+    parser.add_argument("--warnings", type=int, default=0, help="warning lines per remux (default: 0)")
+    parser.add_argument("--size", type=parse_size, default=parse_size("1M"),
+                        help="source size, e.g. 500K or 2G; sources and outputs are sparse where the filesystem "
+                             "supports it (default: 1M)")
+    parser.add_argument("--write", choices=("sparse", "full"), default="sparse",
+                        help="full: the stand-in writes every output byte, to include disk I/O (default: sparse)")
+    parser.add_argument("--audio", default="eng,jpn", help="audio languages of the sources (default: eng,jpn)")
+    parser.add_argument("--subs", default="eng,fre", help="subtitle languages of the sources (default: eng,fre)")
+    parser.add_argument("--scan-jobs", type=int, default=default_scan_jobs(),
+                        help=f"files identified in parallel (default: {default_scan_jobs()})")
+    parser.add_argument("--device-jobs", type=int, default=0,
+                        help="per-disk job limit (default: 0, no limit)")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per render timing, median kept (default: 5)")
+    parser.add_argument("--workdir", type=Path, help="where sources and outputs go (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the work dir")
+    parser.add_argument("--save", type=Path, help="write the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="compare with results saved by an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against --baseline before it counts as a regression (default: 0.25)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    suites = args.suite or list(SUITES)
+    uis = [u.strip() for u in args.ui.split(",") if u.strip()]
+    bad = [u for u in uis if u not in UIS]
+    if bad or not args.files or not args.jobs or min(args.files + args.jobs) < 1:
+        print(f"error: --files and --jobs need positive numbers and --ui takes {', '.join(UIS)}", file=sys.stderr)
+        return 2
+    if "gui" in uis and "batch" in suites and not _gui_available():
+        print("note: no display for Tk, skipping --ui gui", file=sys.stderr)
+        uis.remove("gui")
+
+    # the stand-in reads its behaviour from the environment it inherits
+    os.environ.update({
+        "FAKE_MKVMERGE_DURATION": str(args.duration),
+        "FAKE_MKVMERGE_PROGRESS_LINES": str(args.progress_lines),
+        "FAKE_MKVMERGE_IDENTIFY_DELAY": str(args.identify_delay),
+        "FAKE_MKVMERGE_WARNINGS": str(args.warnings),
+        "FAKE_MKVMERGE_WRITE": args.write,
+    })
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="remux-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    results = []
+    try:
+        mkvmerge_path = install_fake(workdir)
+        print(f"# {mkvmerge_version(mkvmerge_path)}, Python {platform.python_version()}, {os.cpu_count()} CPUs, "
+              f"work dir {workdir}", flush=True)
+        for count in args.files:
+            files = []
+            if "scan" in suites or "batch" in suites:
+                files = make_sources(workdir / f"src-{count}", count, args.size,
+                                     args.audio.split(","), args.subs.split(","))
+            batch = []
+            if "scan" in suites:
+                batch += bench_scan(mkvmerge_path, files, args)
+            if "render" in suites:
+                batch += bench_render(count, args)
+            for rec in batch:
+                print_record(rec)
+            results += batch
+            if "batch" in suites:
+                for jobs in args.jobs:
+                    for ui in uis:
+                        results.append(bench_batch(mkvmerge_path, files, jobs, ui, workdir, args))
+                        print_record(results[-1])
+    except KeyboardInterrupt:
+        print("interrupted", file=sys.stderr)
+        return 130
+    finally:
+        if not args.keep and args.workdir is None:
+            shutil.rmtree(str(workdir), ignore_errors=True)
+
+    if args.save is not None:
+        args.save.write_text(json.dumps({"python": platform.python_version(), "results": results}, indent=1),
+                             encoding="utf-8")
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for rid, name, before, after in regressions:
+            print(f"REGRESSION {rid} {name}: {_fmt(before)} -> {_fmt(after)} (+{(after / before - 1) * 100:.0f}%)")
+        if regressions:
+            return 1
+        print(f"no regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
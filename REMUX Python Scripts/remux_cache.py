@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+remux_cache.py
+Persistent SQLite cache of parsed `mkvmerge --identify` results.
+Entries are keyed by absolute path and only reused while the file size, mtime and the
+mkvmerge version all still match; the least recently used entries are pruned past a size cap.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 50000
+CACHE_FILENAME = "identify_cache.sqlite3"
+
+# (absolute path, size, mtime_ns, mkvmerge version)
+CacheKey = Tuple[str, int, int, str]
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory for the remux tools."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or str(Path.home() / "AppData" / "Local")
+    elif sys.platform == "darwin":
+        base = str(Path.home() / "Library" / "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "mkv-batch-remux"
+
+
+class IdentifyCache:
+    """Thread-safe on-disk store of identify JSON. Failed identifications are never cached."""
+
+    def __init__(self, db_path: Path, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.DatabaseError:
+            # e.g. network filesystems without shared-memory support; the default journal still works
+            pass
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS identify ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " version TEXT NOT NULL, data TEXT NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS identify_used ON identify(used)")
+        self._conn.commit()
+        self.prune()
+
+    @classmethod
+    def open_default(cls, max_entries: int = DEFAULT_MAX_ENTRIES) -> Optional["IdentifyCache"]:
+        """Open the cache in the user cache dir, or return None if it cannot be created."""
+        try:
+            return cls(default_cache_dir() / CACHE_FILENAME, max_entries)
+        except (OSError, sqlite3.Error):
+            return None
+
+    @staticmethod
+    def key(src: Path, version: str) -> Optional[CacheKey]:
+        """Build the lookup key for src; stat it before identifying so later edits invalidate."""
+        try:
+            st = os.stat(str(src))
+        except OSError:
+            return None
+        return (os.path.abspath(str(src)), st.st_size, st.st_mtime_ns, version)
+
+    def get(self, key: Optional[CacheKey]) -> Optional[dict]:
+        if key is None:
+            return None
+        path, size, mtime_ns, version = key
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, version, data FROM identify WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if (row[0], row[1], row[2]) != (size, mtime_ns, version):
+                # file changed or mkvmerge was upgraded: drop the stale entry
+                self._conn.execute("DELETE FROM identify WHERE path = ?", (path,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE identify SET used = ? WHERE path = ?", (time.time(), path))
+            self._conn.commit()
+            self.hits += 1
+        try:
+            return json.loads(row[3])
+        except ValueError:
+            return None
+
+    def put(self, key: Optional[CacheKey], data: dict):
+        if key is None:
+            return
+        path, size, mtime_ns, version = key
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO identify (path, size, mtime_ns, version, data, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, version, json.dumps(data, separators=(",", ":")), time.time()),
+            )
+            self._conn.commit()
+            self._puts += 1
+            check_size = self._puts % 256 == 0
+        if check_size:
+            self.prune()
+
+    def prune(self):
+        """Drop least recently used entries beyond max_entries."""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM identify").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM identify WHERE path IN (SELECT path FROM identify ORDER BY used ASC LIMIT ?)",
+                    (excess,),
+                )
+                self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM identify")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,804 @@
+#!/usr/bin/env python3
+"""
+remux_engine.py
+Batch remux engine shared by the CLI and GUI: mkvmerge discovery and identification, the
+language scan, the per-file remux routine and RemuxEngine, which owns the job list, the
+device-aware scheduler, the batch statistics and the run log. Frontends add files, subscribe
+to batched progress events and draw them; they never touch workers or mkvmerge themselves.
+"""
+
+import functools
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from mkv_ebml import read_tracks
+from remux_cache import IdentifyCache
+from remux_fileops import clean_stale_temps, commit_temp, discard_temp, place_unchanged, temp_path
+from remux_journal import DONE, FAILED, IDENTIFIED, STARTED, JobJournal
+from remux_proc import supervisor
+from remux_sched import DEFAULT_DEVICE_JOBS, DeviceScheduler, job_devices, job_priority
+from remux_stats import BatchStats, ThroughputModel
+from remux_trace import TraceWriter
+
+# language list value meaning "keep every track of this type"
+ALL_LANGS = "all"
+# subscribers get the changed jobs at most this often
+EVENT_INTERVAL = 0.1
+
+RE_PROGRESS = re.compile(r"(?:#GUI#progress|Progress:)\s*([0-9]{1,3})")
+# mkvmerge warning and error lines, with and without --gui-mode
+RE_WARNING = re.compile(r"^(?:#GUI#warning|Warning:)")
+RE_ERROR = re.compile(r"^(?:#GUI#error|Error:)")
+
+# ---------- Helpers ----------
+
+def default_jobs() -> int:
+    """Number of concurrent mkvmerge processes used by default."""
+    return max(1, min(4, os.cpu_count() or 1))
+
+def default_scan_jobs() -> int:
+    """Concurrent identify calls during the language scan; they mostly wait on disk, so allow more than cores."""
+    return max(2, min(8, (os.cpu_count() or 1) * 2))
+
+def parse_lang_list(text: str) -> list:
+    """'eng, JPN' -> ['eng', 'jpn']; 'none' or '' -> []."""
+    langs = [lang.strip().lower() for lang in text.split(",") if lang.strip()]
+    return [] if langs == ["none"] else langs
+
+def lang_selected(lang: str, langs: list) -> bool:
+    return lang in langs or ALL_LANGS in langs
+
+def find_mkvmerge() -> Optional[str]:
+    mk = shutil.which("mkvmerge") or shutil.which("mkvmerge.exe")
+    if mk:
+        return mk
+    candidate = r"C:\Program Files\MKVToolNix\mkvmerge.exe"
+    return candidate if Path(candidate).exists() else None
+
+@functools.lru_cache(maxsize=None)
+def mkvmerge_version(mkvmerge_path: str) -> str:
+    """First line of `mkvmerge --version`; part of the identify cache key."""
+    try:
+        res = subprocess.run([mkvmerge_path, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             text=True, timeout=10.0, check=False)
+        return res.stdout.strip().splitlines()[0] if res.stdout.strip() else ""
+    except Exception:
+        return ""
+
+def file_stamp(path: Path):
+    """(size, mtime_ns) used to tell whether a scanned file changed before the remux started."""
+    try:
+        st = path.stat()
+        return (st.st_size, st.st_mtime_ns)
+    except OSError:
+        return None
+
+def fmt_time(sec: Optional[float]) -> str:
+    if sec is None:
+        return "--:--"
+    try:
+        s = int(round(sec))
+        m, s = divmod(s, 60)
+        return f"{m:02d}:{s:02d}"
+    except (ValueError, TypeError):
+        return "--:--"
+
+def fmt_size(num_bytes: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1000:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1000
+    return f"{num_bytes:.1f} TB"
+
+# ---------- Identification ----------
+
+def identify_tracks(mkvmerge_path: str, src: Path, timeout: float = 10.0, cache: Optional[IdentifyCache] = None,
+                    backend: str = "mkvmerge"):
+    # "auto": try the built-in Matroska header reader first and fall back to mkvmerge for unusual files
+    # "via" in the result says where the track list came from
+    if backend == "auto":
+        data = read_tracks(src)
+        if data is not None:
+            return {"ok": True, "data": data, "via": "header"}
+    key = cache.key(src, mkvmerge_version(mkvmerge_path)) if cache is not None else None
+    if key is not None:
+        data = cache.get(key)
+        if data is not None:
+            return {"ok": True, "data": data, "cached": True, "via": "cache"}
+    cmd = [mkvmerge_path, "--identify", "--identification-format", "json", str(src)]
+    try:
+        res = supervisor().run(cmd, timeout=timeout, merge_stderr=False)
+        if res.timed_out:
+            return {"ok": False, "err": f"timed out after {timeout:g}s"}
+        if res.returncode != 0:
+            return {"ok": False, "err": res.stderr.strip() or res.output.strip() or f"rc={res.returncode}"}
+        data = json.loads(res.output)
+    except Exception as e:
+        return {"ok": False, "err": str(e)}
+    if key is not None:
+        cache.put(key, data)
+    return {"ok": True, "data": data, "via": "mkvmerge"}
+
+def iter_identify(mkvmerge_path: str, files: list, cache: Optional[IdentifyCache] = None,
+                  jobs: Optional[int] = None, backend: str = "mkvmerge"):
+    """
+    Identify files on a bounded thread pool, yielding (path, identify result) as each one finishes.
+    Each result also holds the "seconds" its identify took.
+    """
+    def timed(f):
+        t0 = time.monotonic()
+        ident = identify_tracks(mkvmerge_path, f, cache=cache, backend=backend)
+        ident["seconds"] = time.monotonic() - t0
+        return ident
+
+    pool = ThreadPoolExecutor(max_workers=jobs or default_scan_jobs())
+    futures = {pool.submit(timed, f): f for f in files}
+    try:
+        for fut in as_completed(futures):
+            yield futures[fut], fut.result()
+    finally:
+        # on Ctrl+C (or a caller that stops early) drop the queued identifies instead of
+        # waiting for all of them; only the few already running are left to finish
+        for fut in futures:
+            fut.cancel()
+        pool.shutdown(wait=False)
+
+def get_available_languages(mkvmerge_path: str, files: list, cache: Optional[IdentifyCache] = None,
+                            jobs: Optional[int] = None, on_progress=None, backend: str = "mkvmerge"):
+    """
+    Scan all files and return available audio and subtitle languages, plus a
+    {path: identify result} table that RemuxEngine.add() reuses instead of identifying again.
+    Files are identified in parallel; on_progress(scanned, total, failed, audio_langs, sub_langs)
+    is called after each file with the languages found so far.
+    """
+    all_audio_langs = set()
+    all_sub_langs = set()
+    tracks_by_file = {}
+    scanned = 0
+    failed = 0
+
+    for file, ident in iter_identify(mkvmerge_path, files, cache, jobs, backend):
+        scanned += 1
+        if not ident["ok"]:
+            failed += 1
+            if on_progress:
+                on_progress(scanned, len(files), failed, sorted(all_audio_langs), sorted(all_sub_langs))
+            continue
+        ident["stamp"] = file_stamp(file)
+        tracks_by_file[file] = ident
+
+        for track in ident["data"].get("tracks", []):
+            track_type = track.get("type", "").lower()
+            lang = track.get("properties", {}).get("language", "und").lower()
+
+            if track_type == "audio":
+                all_audio_langs.add(lang)
+            elif track_type in ("subtitles", "subtitle"):
+                all_sub_langs.add(lang)
+        if on_progress:
+            on_progress(scanned, len(files), failed, sorted(all_audio_langs), sorted(all_sub_langs))
+
+    return sorted(all_audio_langs), sorted(all_sub_langs), tracks_by_file
+
+# ---------- Remux ----------
+
+def select_tracks(ident_data: dict, audio_langs: list, sub_langs: list):
+    """Return (audio_ids, sub_ids, audio_total, sub_total) for an identify result."""
+    audio_ids = []
+    sub_ids = []
+    audio_total = 0
+    sub_total = 0
+    for t in ident_data.get("tracks", []):
+        ttype = (t.get("type") or "").lower()
+        props = t.get("properties") or {}
+        lang = (props.get("language") or "und").lower()
+        tid = t.get("id")
+        if ttype == "audio":
+            audio_total += 1
+            if isinstance(tid, int) and lang_selected(lang, audio_langs):
+                audio_ids.append(tid)
+        elif ttype in ("subtitles", "subtitle"):
+            sub_total += 1
+            if isinstance(tid, int) and lang_selected(lang, sub_langs):
+                sub_ids.append(tid)
+    return audio_ids, sub_ids, audio_total, sub_total
+
+def build_command(mkvmerge_path: str, src_path: Path, out_path: Path, audio_ids: list, sub_ids: list) -> list:
+    cmd = [mkvmerge_path, "-o", str(out_path), "--audio-tracks", ",".join(map(str, audio_ids))]
+    if sub_ids:
+        cmd += ["--subtitle-tracks", ",".join(map(str, sub_ids))]
+    else:
+        cmd += ["--no-subtitles"]
+    cmd += ["--ui-language", "en", "--gui-mode", str(src_path)]
+    return cmd
+
+def new_job(key: int, src: Path, name: str) -> dict:
+    """Fresh state for a queued file; the engine updates it in place."""
+    return {
+        "key": key,
+        "no": key + 1,
+        "src": src,
+        "fullname": name,
+        "pct": 0,
+        "elapsed": 0.0,
+        "remaining": None,
+        "status_text": "Queued",
+        "finished": False,
+        "success": False,
+        "start_time": None,
+    }
+
+def _finish(job: dict, update, success: bool, status: str, **fields):
+    job.update(fields)
+    job["finished"] = True
+    job["success"] = success
+    job["status_text"] = status
+    if "remaining" not in fields:
+        job["remaining"] = 0.0
+    update(job)
+
+def remux_file(mkvmerge_path: str, src_path: Path, out_path: Path, job: dict, update: Callable[[dict], None],
+               audio_langs: list, sub_langs: list, skip_if_exists: bool, dry_run: bool,
+               unchanged: str = "remux", cache: Optional[IdentifyCache] = None, ident: Optional[dict] = None,
+               log_commands: Optional[list] = None, on_phase: Optional[Callable[..., None]] = None):
+    """
+    Remux one file, updating `job` in place and calling update(job) on every change.
+    Pass the identify result from the language scan as `ident` to skip a second identify.
+    Files that already contain only selected tracks are handled per `unchanged`
+    (see remux_fileops.UNCHANGED_MODES) instead of being rewritten by mkvmerge.
+    mkvmerge writes to remux_fileops.temp_path(out_path), which is renamed to out_path only on
+    success, so a failed or killed job never leaves a partial file that looks like an output.
+    on_phase(name, seconds, **details) is called as each phase ends (see remux_trace).
+    Returns (success, elapsed_seconds, reason) for logging.
+    """
+    if log_commands is None:
+        log_commands = []
+    if on_phase is None:
+        def on_phase(name, seconds, **details):
+            pass
+
+    # prepare job
+    job["status_text"] = "Pending"
+    job["pct"] = 0
+    job["elapsed"] = 0.0
+    job["remaining"] = None
+    job["finished"] = False
+    job["success"] = False
+    job["start_time"] = time.time()
+    update(job)
+
+    # skip if exists
+    if skip_if_exists and out_path.exists() and out_path.stat().st_size > 0:
+        _finish(job, update, True, "Skipped (exists)", pct=100, elapsed=0.0)
+        return True, 0.0, "Skipped (exists)"
+
+    # identify tracks
+    if ident is None:
+        t0 = time.monotonic()
+        ident = identify_tracks(mkvmerge_path, src_path, cache=cache)
+        on_phase("identify", time.monotonic() - t0, via=ident.get("via"), ok=ident["ok"])
+    if not ident["ok"]:
+        _finish(job, update, False, "FAILED identify", pct=0, elapsed=0.0)
+        return False, 0.0, f"identify failed: {ident.get('err')}"
+
+    audio_ids, sub_ids, audio_total, sub_total = select_tracks(ident["data"], audio_langs, sub_langs)
+
+    if not audio_ids:
+        _finish(job, update, False, "No desired audio", pct=0, elapsed=0.0)
+        return False, 0.0, "no desired audio"
+
+    # nothing would be removed: place the source as-is instead of a full mkvmerge rewrite
+    if unchanged != "remux" and len(audio_ids) == audio_total and len(sub_ids) == sub_total:
+        try:
+            src_size = src_path.stat().st_size
+        except OSError:
+            src_size = 0
+        if dry_run:
+            _finish(job, update, True, "Dry-run (unchanged)", pct=100)
+            return True, 0.0, "dry-run (unchanged)"
+        start = time.time()
+        t_place = time.monotonic()
+        try:
+            done = place_unchanged(src_path, out_path, unchanged)
+        except OSError as e:
+            on_phase("place", time.monotonic() - t_place, mode=unchanged, ok=False)
+            _finish(job, update, False, f"FAILED ({unchanged})", elapsed=time.time() - start)
+            return False, job["elapsed"], f"{unchanged} failed: {e}"
+        on_phase("place", time.monotonic() - t_place, mode=done, ok=True, bytes_written=0 if done == "skipped" else src_size)
+        if done != "skipped":
+            log_commands.append(f"{done}: {src_path} -> {out_path}")
+        _finish(job, update, True, f"Unchanged ({done})", pct=100, elapsed=time.time() - start, bytes_saved=src_size,
+                bytes_processed=src_size if done == "copied" else 0)
+        return True, job["elapsed"], f"unchanged: {done}"
+
+    tmp_path = temp_path(out_path)
+    cmd = build_command(mkvmerge_path, src_path, tmp_path, audio_ids, sub_ids)
+    log_commands.append(" ".join(cmd))
+
+    if dry_run:
+        _finish(job, update, True, "Dry-run (skipped)", pct=100)
+        return True, 0.0, "dry-run"
+
+    src_size = src_path.stat().st_size if src_path.exists() else None
+    had_progress = False
+    warnings = 0
+    errors = 0
+    start = time.time()
+
+    def set_progress(pct):
+        job["pct"] = pct
+        job["elapsed"] = time.time() - start
+        job["remaining"] = (job["elapsed"] * (100 - pct) / pct) if pct > 0 else None
+        job["status_text"] = "Processing"
+        update(job)
+
+    # both callbacks run on the supervisor's event loop thread
+    def on_line(line):
+        nonlocal had_progress, warnings, errors
+        m = RE_PROGRESS.search(line)
+        if m:
+            had_progress = True
+            set_progress(max(0, min(100, int(m.group(1)))))
+        elif RE_WARNING.match(line):
+            warnings += 1
+        elif RE_ERROR.match(line):
+            errors += 1
+
+    def on_idle():
+        # fallback filesize based progress (if mkvmerge doesn't emit progress)
+        if (not had_progress) and src_size and tmp_path.exists():
+            try:
+                pct = int(min(99, (tmp_path.stat().st_size / src_size) * 100))
+            except OSError:
+                pct = 0
+            if pct > job["pct"]:
+                set_progress(pct)
+
+    t_spawn = time.monotonic()
+    try:
+        res = supervisor().run(cmd, on_line=on_line, on_idle=on_idle, keep_lines=12)
+    except Exception as e:
+        discard_temp(tmp_path)
+        on_phase("spawn", time.monotonic() - t_spawn, ok=False, error=str(e))
+        _finish(job, update, False, "Launch failed", pct=0, elapsed=0.0)
+        return False, 0.0, f"launch error: {e}"
+
+    rc = res.returncode
+    on_phase("spawn", res.spawn_seconds, ok=True)
+    on_phase("mux", res.run_seconds, rc=rc, timed_out=res.timed_out, warnings=warnings, errors=errors,
+             bytes_read=src_size)
+    t_final = time.monotonic()
+    written = tmp_path.stat().st_size if rc == 0 and tmp_path.exists() else 0
+    if written > 0:
+        try:
+            commit_temp(tmp_path, out_path)
+        except OSError as e:
+            discard_temp(tmp_path)
+            on_phase("finalize", time.monotonic() - t_final, ok=False, error=str(e))
+            elapsed = time.time() - start
+            _finish(job, update, False, "FAILED (rename)", elapsed=elapsed)
+            return False, elapsed, f"rename failed: {e}"
+        on_phase("finalize", time.monotonic() - t_final, ok=True, bytes_written=written)
+        elapsed = time.time() - start
+        _finish(job, update, True, "OK", pct=100, elapsed=elapsed, bytes_processed=src_size or 0)
+        return True, elapsed, "OK"
+    elapsed = time.time() - start
+    discard_temp(tmp_path)
+    # keep the progress as is, don't reset to 0
+    _finish(job, update, False, "FAILED" if "Error" in res.output else f"FAILED (rc={rc})", elapsed=elapsed)
+    return False, elapsed, f"rc={rc}"
+
+# ---------- Engine ----------
+
+@dataclass
+class RemuxOptions:
+    """Everything that decides what a batch does, shared by every file in it."""
+    output_dir: Path
+    audio_langs: List[str]
+    sub_langs: List[str]
+    # outputs mirror each file's location below input_dir; without it they go flat into output_dir
+    input_dir: Optional[Path] = None
+    skip_if_exists: bool = True
+    dry_run: bool = False
+    unchanged: str = "copy"
+    jobs: int = field(default_factory=default_jobs)
+    device_jobs: int = DEFAULT_DEVICE_JOBS
+    order: str = "name"
+    scan_jobs: int = field(default_factory=default_scan_jobs)
+
+
+class RemuxEngine:
+    """
+    Runs one batch. add() queues a file (identifying it first on a separate pool when no scan
+    result is passed), close() says no more files are coming and wait() blocks until every file
+    is done. Subscribers get lists of events at most every EVENT_INTERVAL seconds, with each
+    changed job reported once in its latest state:
+        {"type": "job", "key": k, "job": {...copy of the job dict...}}
+        {"type": "done", "batch": stats snapshot}   (last event of the batch)
+    `jobs` holds the live job dicts in add order (index == key) for frontends that draw them directly.
+    With a `journal`, every file's progress is recorded in it; a journal opened with resume=True
+    also makes add() pass over files finished by the earlier run and redo interrupted ones.
+    With a `trace`, per-phase timings of every file are written to it (see remux_trace).
+    """
+
+    def __init__(self, mkvmerge_path: str, options: RemuxOptions, cache: Optional[IdentifyCache] = None,
+                 throughput: Optional[ThroughputModel] = None, journal: Optional[JobJournal] = None,
+                 trace: Optional[TraceWriter] = None):
+        self.mkvmerge_path = mkvmerge_path
+        self.options = options
+        self.cache = cache
+        self.throughput = throughput
+        # a dry run writes nothing, so there is nothing to resume from
+        self.journal = journal if not options.dry_run else None
+        if self.journal is not None:
+            self.journal.start_run(str(options.input_dir or ""), options.audio_langs, options.sub_langs)
+        # temp files of jobs killed in an earlier run; see remux_fileops.temp_path
+        self.stale_temps_removed = 0 if options.dry_run else clean_stale_temps(options.output_dir)
+        self.trace = trace
+        # key -> {"added", "scheduled", "phases", details} for files being traced
+        self._traced = {}
+        if trace is not None:
+            trace.emit("run_start", options=asdict(options))
+        self.jobs = []
+        self.results = {}
+        # keys of files whose existing output must be overwritten despite skip_if_exists (damaged or replaced)
+        self._redo = set()
+        self.log_commands = []
+        self.start_time = time.time()
+        self.stats = BatchStats(0, options.jobs, self.start_time, growing=True, throughput=throughput)
+        self._subscribers = []
+        self._changed = {}
+        self._lock = threading.Lock()
+        # files added but not finished; wait() watches this rather than joining worker threads,
+        # so an interrupted wait can simply be repeated
+        self._outstanding = 0
+        self._idle = threading.Condition()
+        self._sched = DeviceScheduler(options.jobs, options.device_jobs)
+        self._identify_pool = ThreadPoolExecutor(max_workers=options.scan_jobs)
+        # identifies queued or running on _identify_pool, so cancel() can drop the queued ones
+        self._identifying = set()
+        self._cancelled = threading.Event()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def subscribe(self, callback: Callable[[list], None]):
+        """callback(events) runs on the engine's event thread; keep it quick."""
+        self._subscribers.append(callback)
+
+    def name_of(self, src: Path) -> str:
+        if self.options.input_dir is not None:
+            try:
+                return src.relative_to(self.options.input_dir).as_posix()
+            except ValueError:
+                pass
+        return src.name
+
+    def out_path(self, src: Path) -> Path:
+        if self.options.input_dir is not None:
+            try:
+                return self.options.output_dir / src.relative_to(self.options.input_dir)
+            except ValueError:
+                pass
+        return self.options.output_dir / src.name
+
+    def add(self, src: Path, ident: Optional[dict] = None, overwrite: bool = False) -> dict:
+        """
+        Queue src; `ident` is its scan result, ignored if the file changed since the scan or came
+        from the header reader (the track ids passed to mkvmerge are always mkvmerge's own).
+        overwrite=True remuxes it even if skip_if_exists would skip it (a replaced source).
+        """
+        stamp = file_stamp(src)
+        if ident is not None and (ident.get("via") == "header" or ident.get("stamp", stamp) != stamp):
+            ident = None
+        with self._lock:
+            job = new_job(len(self.jobs), src, self.name_of(src))
+            self.jobs.append(job)
+        with self._idle:
+            self._outstanding += 1
+        if self.trace is not None:
+            self._traced[job["key"]] = {"added": time.monotonic(), "phases": {}}
+            if ident is not None:
+                # identified by the language scan before the batch started
+                self._phase(job, "identify", ident.get("seconds", 0.0), via="scan", ok=ident["ok"])
+        self.stats.add()
+        self.stats.register_path(job["key"], src)
+        self._changed_job(job)
+        opts = self.options
+        out = self.out_path(src)
+        skip_if_exists = opts.skip_if_exists and not overwrite
+        if overwrite:
+            self._redo.add(job["key"])
+        if self.journal is not None:
+            if self.journal.damaged(src, stamp, out):
+                # finished earlier, but the output was cut short or changed since: overwrite it
+                # instead of letting skip-if-exists take it for a good one
+                skip_if_exists = False
+                self._redo.add(job["key"])
+            elif self.journal.finished(src, stamp, out):
+                job.update(finished=True, success=True, status_text="Done (earlier run)", pct=100, remaining=0.0)
+                self.results[job["key"]] = "done in an earlier run"
+                self.stats.finish(job["key"], True, 100)
+                self._changed_job(job)
+                self._trace_job(job, True, "done in an earlier run")
+                self._job_done()
+                return job
+            if ident is None:
+                ident = self.journal.identified(src, stamp)
+                if ident is not None:
+                    self._phase(job, "identify", 0.0, via="journal", ok=True)
+            elif ident["ok"]:
+                self.journal.record(src, IDENTIFIED, stamp, data=ident["data"])
+        if ident is None and not (skip_if_exists and out.exists() and out.stat().st_size > 0):
+            # identify on its own pool so remux workers never wait on it
+            fut = self._identify_pool.submit(self._identify_then_schedule, job)
+            with self._lock:
+                self._identifying.add(fut)
+            fut.add_done_callback(lambda f: self._identified(f, job))
+        else:
+            self._schedule(job, ident)
+        return job
+
+    def close(self):
+        """No more files will be added."""
+        self.stats.close()
+
+    def wait(self):
+        """Block until every added file is finished, then deliver the final events."""
+        with self._idle:
+            while self._outstanding:
+                self._idle.wait(0.5)
+        self._identify_pool.shutdown(wait=True)
+        self._sched.shutdown(wait=True)
+        self._stop.set()
+        self._flusher.join()
+        self._flush()
+        batch = self.stats.snapshot()
+        if self.trace is not None:
+            self.trace.emit("run_end", batch=batch)
+        self._publish([{"type": "done", "batch": batch}])
+
+    def cancel(self):
+        """Drop files that have not started and kill running mkvmerge processes."""
+        self._cancelled.set()
+        with self._lock:
+            identifying = list(self._identifying)
+        for fut in identifying:
+            fut.cancel()
+        self._sched.cancel_pending()
+        supervisor().cancel_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.cancel()
+        self.close()
+        try:
+            self.wait()
+        except KeyboardInterrupt:
+            # interrupted while waiting for the batch: stop it, then let the workers clean up
+            self.cancel()
+            self.wait()
+            raise
+        return False
+
+    # --- workers ---
+
+    def _identified(self, fut, job):
+        with self._lock:
+            self._identifying.discard(fut)
+        if fut.cancelled():
+            self._fail(job, "Cancelled", "cancelled")
+
+    def _identify_then_schedule(self, job):
+        if self._cancelled.is_set():
+            # started just as the batch was cancelled
+            self._fail(job, "Cancelled", "cancelled")
+            return
+        t0 = time.monotonic()
+        ident = identify_tracks(self.mkvmerge_path, job["src"], cache=self.cache)
+        self._phase(job, "identify", time.monotonic() - t0, via=ident.get("via"), ok=ident["ok"])
+        if self.journal is not None and ident["ok"]:
+            self.journal.record(job["src"], IDENTIFIED, file_stamp(job["src"]), data=ident["data"])
+        self._schedule(job, ident)
+
+    def _schedule(self, job, ident):
+        src = job["src"]
+        if job["key"] in self._traced:
+            self._traced[job["key"]]["scheduled"] = time.monotonic()
+        try:
+            fut = self._sched.submit(job_devices(src, self.out_path(src)), self._run, job, ident,
+                                     priority=job_priority(src, self.options.order))
+        except RuntimeError:
+            # cancelled batch
+            self._fail(job, "Cancelled", "cancelled")
+            return
+        fut.add_done_callback(lambda f: self._fail(job, "Cancelled", "cancelled") if f.cancelled() else None)
+
+    def _run(self, job, ident):
+        opts = self.options
+        src = job["src"]
+        out = self.out_path(src)
+        self.stats.start(job["key"])
+        traced = self._traced.get(job["key"])
+        if traced is not None:
+            self._phase(job, "queue_wait", time.monotonic() - traced.get("scheduled", traced["added"]))
+        stamp = file_stamp(src)
+        if self.journal is not None:
+            self.journal.record(src, STARTED, stamp)
+        try:
+            if not opts.dry_run:
+                out.parent.mkdir(parents=True, exist_ok=True)
+            ok, elapsed, reason = remux_file(
+                self.mkvmerge_path, src, out, job, self._update, opts.audio_langs, opts.sub_langs,
+                opts.skip_if_exists and job["key"] not in self._redo, opts.dry_run, opts.unchanged, self.cache, ident,
+                self.log_commands,
+                on_phase=None if traced is None else lambda name, seconds, **d: self._phase(job, name, seconds, **d))
+        except Exception as e:
+            self._fail(job, "Error", str(e))
+            return
+        if not ok and self._cancelled.is_set():
+            # mkvmerge was killed by cancel(): the file was stopped, not broken
+            job["status_text"] = "Cancelled"
+            reason = "cancelled"
+        self.results[job["key"]] = reason
+        if self.journal is not None:
+            if ok:
+                out_size = out.stat().st_size if out.exists() else None
+                self.journal.record(src, DONE, stamp, out_size=out_size)
+            else:
+                self.journal.record(src, FAILED, stamp, reason=reason)
+        # only successful files feed the per-file time average and throughput used for the ETA
+        self.stats.finish(job["key"], ok, int(job.get("pct", 0)), elapsed if ok else None,
+                          job.get("bytes_processed", 0) if ok else 0)
+        self._changed_job(job)
+        self._trace_job(job, ok, reason)
+        self._job_done()
+
+    def _fail(self, job, status, reason):
+        job.update(finished=True, success=False, status_text=status, remaining=0.0)
+        self.results[job["key"]] = reason
+        if self.journal is not None:
+            self.journal.record(job["src"], FAILED, file_stamp(job["src"]), reason=reason)
+        self.stats.finish(job["key"], False)
+        self._changed_job(job)
+        self._trace_job(job, False, reason)
+        self._job_done()
+
+    def _job_done(self):
+        with self._idle:
+            self._outstanding -= 1
+            self._idle.notify_all()
+
+    def _update(self, job):
+        # byte-based estimate from the device throughput model replaces mkvmerge's linear one
+        remaining = self.stats.progress(job["key"], int(job.get("pct", 0)), job.get("elapsed"))
+        if remaining is not None and not job.get("finished"):
+            job["remaining"] = remaining
+        self._changed_job(job)
+
+    # --- trace ---
+
+    def _phase(self, job, name, seconds, **details):
+        traced = self._traced.get(job["key"])
+        if traced is None:
+            return
+        traced["phases"][name] = round(traced["phases"].get(name, 0.0) + seconds, 4)
+        for k in ("rc", "warnings", "errors", "bytes_read", "bytes_written"):
+            if k in details:
+                traced[k] = details[k]
+        self.trace.emit("phase", key=job["key"], src=str(job["src"]), phase=name, seconds=round(seconds, 4), **details)
+
+    def _trace_job(self, job, ok, reason):
+        traced = self._traced.pop(job["key"], None)
+        if traced is None:
+            return
+        phases = traced["phases"]
+        bytes_read = traced.get("bytes_read")
+        mux = phases.get("mux")
+        self.trace.emit(
+            "job", key=job["key"], src=str(job["src"]), out=str(self.out_path(job["src"])), ok=ok,
+            status=job.get("status_text"), reason=reason, rc=traced.get("rc"), warnings=traced.get("warnings"),
+            errors=traced.get("errors"), bytes_read=bytes_read, bytes_written=traced.get("bytes_written"),
+            read_mbps=round(bytes_read / mux / 1e6, 2) if bytes_read and mux else None,
+            seconds=round(time.monotonic() - traced["added"], 4), phases=phases)
+
+    # --- events ---
+
+    def _changed_job(self, job):
+        with self._lock:
+            self._changed[job["key"]] = job
+
+    def _flush(self):
+        with self._lock:
+            changed, self._changed = self._changed, {}
+        if changed:
+            self._publish([{"type": "job", "key": key, "job": dict(job)} for key, job in changed.items()])
+
+    def _publish(self, events):
+        for callback in self._subscribers:
+            callback(events)
+
+    def _flush_loop(self):
+        while not self._stop.wait(EVENT_INTERVAL):
+            self._flush()
+
+    # --- log ---
+
+    def write_log_header(self, log_path: Path, input_desc: str):
+        opts = self.options
+        with open(log_path, "a", encoding="utf-8") as lf:
+            lf.write(f"==== remux run: {time.strftime('%Y-%m-%d %H:%M:%S')} ====\n")
+            lf.write(f"Input dir: {input_desc}\nOutput dir: {opts.output_dir}\n")
+            lf.write(f"Jobs: {opts.jobs} (per disk: {opts.device_jobs or 'unlimited'}), order: {opts.order}\n")
+            lf.write(f"Audio languages: {', '.join(opts.audio_langs)}\n"
+                     f"Subtitle languages: {', '.join(opts.sub_langs)}\n")
+            if self.stale_temps_removed:
+                lf.write(f"Removed {self.stale_temps_removed} unfinished temp file(s) of an earlier run\n")
+            lf.write("\n")
+
+    def write_log_summary(self, log_path: Path):
+        """Per-file table, totals, identify cache use and a sample of the commands run."""
+        lines = ["SL No.\tFilename\tProgress\tElapsed\tRemaining\tStatus\tResult"]
+        for r in self.jobs:
+            result = "OK" if r.get("success") else ("FAILED" if r.get("finished") else "")
+            lines.append(
+                f"{r['no']}\t{r['fullname']}\t{int(r.get('pct', 0))}%\t{fmt_time(r.get('elapsed'))}\t"
+                f"{fmt_time(r.get('remaining'))}\t{r.get('status_text', '')}\t{result}")
+        unchanged_count, bytes_saved = self.unchanged_totals()
+        with open(log_path, "a", encoding="utf-8") as lf:
+            lf.write("\n".join(lines) + "\n\n")
+            lf.write(f"=== Summary ===\nProcessed: {len(self.jobs)}, OK: {self.stats.ok}, Failed: {self.stats.failed}\n"
+                     f"Total time: {fmt_time(time.time() - self.start_time)}\n")
+            if unchanged_count:
+                lf.write(f"Unchanged (not remuxed): {unchanged_count} file(s), {fmt_size(bytes_saved)} saved\n")
+            if self.cache is not None:
+                lf.write(f"Identify cache: {self.cache.hits} hits, {self.cache.misses} misses\n")
+            if self.log_commands:
+                lf.write("\nCommands executed (sample):\n")
+                for c in self.log_commands[:10]:
+                    lf.write(c + "\n")
+            lf.write("\n")
+
+    def unchanged_totals(self):
+        """(files placed without a remux, bytes not rewritten)."""
+        saved = [r["bytes_saved"] for r in self.jobs if "bytes_saved" in r]
+        return len(saved), sum(saved)
+
+    def cancelled_count(self) -> int:
+        """Files stopped or dropped by cancel(); stats count them among the failed."""
+        return sum(1 for reason in list(self.results.values()) if reason == "cancelled")
+
+    def status(self) -> dict:
+        """
+        Current state for monitoring (see remux_metrics): the stats snapshot plus batch
+        throughput, the files being remuxed with their progress and rate, and failed files.
+        """
+        batch = self.stats.snapshot()
+        batch["bytes_per_sec"] = batch["bytes_done"] / batch["elapsed"] if batch["elapsed"] > 0 else 0.0
+        running = []
+        failed = []
+        for job in list(self.jobs):
+            if job["finished"]:
+                if not job["success"]:
+                    failed.append({"no": job["no"], "name": job["fullname"], "status": job["status_text"],
+                                   "reason": self.results.get(job["key"])})
+            elif job["start_time"] is not None:
+                size = self.stats.file_size(job["key"])
+                elapsed = job.get("elapsed") or 0.0
+                pct = int(job.get("pct", 0))
+                running.append({"no": job["no"], "name": job["fullname"], "status": job["status_text"], "pct": pct,
+                                "elapsed": elapsed, "remaining": job.get("remaining"), "size": size,
+                                "bytes_per_sec": size * pct / 100 / elapsed if size and elapsed > 0 else None})
+        return {"batch": batch, "running": running, "failed": failed}
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+remux_fileops.py
+Filesystem helpers for a batch: MKV discovery (optionally recursive), atomic output writes
+and placement of files whose track set already matches the selection, which are skipped,
+hard-linked, reflinked or copied in-kernel into the output dir instead of a full mkvmerge
+rewrite.
+Outputs are written to a temporary name next to their final path and renamed over it only once
+complete, so anything found at an output path is a whole file.
+"""
+
+import fnmatch
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+# how to handle files that already contain only the selected tracks
+UNCHANGED_MODES = ("copy", "link", "reflink", "skip", "remux")
+
+# Linux FICLONE ioctl (btrfs, XFS, bcachefs, ...)
+_FICLONE = 0x40049409
+
+# outputs are written as ".<name>.remux-part" in the destination dir and renamed when complete
+TEMP_PREFIX = "."
+TEMP_SUFFIX = ".remux-part"
+# temp files untouched for this long belong to no running job
+STALE_TEMP_AGE = 60.0
+
+
+def matches_exclude(name: str, rel_path: str, exclude) -> bool:
+    """True if an entry's name or '/'-separated path relative to the input dir matches a pattern."""
+    return any(fnmatch.fnmatch(name, pat) or fnmatch.fnmatch(rel_path, pat) for pat in exclude)
+
+
+def iter_mkv_files(input_dir: Path, recursive: bool = False, exclude=(), follow_symlinks: bool = False,
+                   skip_dirs=()):
+    """
+    Yield .mkv files under input_dir, directory by directory in name order, as the tree is read.
+    exclude holds fnmatch patterns tested against each entry's name and its '/'-separated path
+    relative to input_dir; an excluded directory is not descended into. Symlinked directories are
+    only entered with follow_symlinks, every real directory is visited once (so link loops end),
+    and directories in skip_dirs (such as an output dir inside the input tree) are skipped.
+    """
+    skip = {os.path.realpath(str(d)) for d in skip_dirs}
+    seen = set()
+    stack = [(str(input_dir), "")]
+    while stack:
+        path, rel = stack.pop()
+        try:
+            st = os.stat(path)
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel}/{entry.name}" if rel else entry.name
+            if matches_exclude(entry.name, rel_path, exclude):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    if recursive and os.path.realpath(entry.path) not in skip:
+                        subdirs.append((entry.path, rel_path))
+                elif entry.name.lower().endswith(".mkv") and entry.is_file():
+                    yield Path(entry.path)
+            except OSError:
+                continue
+        # pushed in reverse so subdirectories are walked in name order
+        stack.extend(reversed(subdirs))
+
+
+def _remove(path: Path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+def temp_path(out_path: Path) -> Path:
+    """Temporary name an output is written under; same directory, so the final rename is atomic."""
+    return out_path.with_name(f"{TEMP_PREFIX}{out_path.name}{TEMP_SUFFIX}")
+
+
+def commit_temp(tmp: Path, out_path: Path):
+    """Move a finished temp file over out_path in one step (replacing an older output)."""
+    os.replace(str(tmp), str(out_path))
+
+
+def discard_temp(tmp: Path):
+    _remove(tmp)
+
+
+def clean_stale_temps(output_dir: Path, max_age: float = STALE_TEMP_AGE) -> int:
+    """
+    Delete temp files left in the output tree by jobs that were killed or crashed. Files written
+    to within max_age seconds are kept, as they may belong to another run still in progress.
+    Returns the number of files removed.
+    """
+    removed = 0
+    cutoff = time.time() - max_age
+    for dirpath, _, filenames in os.walk(str(output_dir)):
+        for name in filenames:
+            if not (name.startswith(TEMP_PREFIX) and name.endswith(TEMP_SUFFIX)):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
+
+
+def copy_fast(src: Path, dst: Path):
+    """
+    Copy src to dst with os.copy_file_range where available, which keeps the data in the
+    kernel and lets filesystems that support it clone extents or copy server-side.
+    Falls back to shutil.copyfile.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(str(src), "rb") as fsrc, open(str(dst), "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+                    if n == 0:
+                        break
+                    remaining -= n
+            if remaining == 0:
+                return
+        except OSError:
+            pass
+    shutil.copyfile(str(src), str(dst))
+
+
+def reflink(src: Path, dst: Path) -> bool:
+    """Clone src into dst sharing the same extents. Returns False if the filesystem cannot."""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    try:
+        with open(str(src), "rb") as fsrc, open(str(dst), "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        _remove(dst)
+        return False
+
+
+def place_unchanged(src: Path, dst: Path, mode: str) -> str:
+    """
+    Put an unchanged source file at dst according to mode ("copy", "link", "reflink", "skip").
+    link and reflink fall back to copying when the filesystem does not allow them. The file is
+    prepared under temp_path(dst) and renamed into place, so dst is never left half-copied.
+    Returns what was actually done: "skipped", "linked", "reflinked" or "copied".
+    """
+    if mode == "skip":
+        return "skipped"
+    if dst.exists() and os.path.samefile(str(src), str(dst)):
+        return "linked"
+    tmp = temp_path(dst)
+    _remove(tmp)
+    try:
+        done = None
+        if mode == "link":
+            try:
+                os.link(str(src), str(tmp))
+                done = "linked"
+            except OSError:
+                pass
+        elif mode == "reflink":
+            if reflink(src, tmp):
+                done = "reflinked"
+        if done is None:
+            copy_fast(src, tmp)
+            done = "copied"
+        commit_temp(tmp, dst)
+    except BaseException:
+        discard_temp(tmp)
+        raise
+    return done
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+remux_journal.py
+Append-only JSONL journal of per-file state transitions, written to the output directory
+while a batch runs. Every line is one record and is flushed as soon as it is written, so after
+a crash or Ctrl+C the journal says which files finished, which were cut off half-way and what
+each source's tracks were. A resumed run replays it: finished files are not touched again,
+interrupted ones are redone and recorded identify results replace a new scan.
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+JOURNAL_FILENAME = "remux_journal.jsonl"
+
+# file states, in the order a file normally goes through them
+IDENTIFIED = "identified"
+STARTED = "started"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobJournal:
+    """
+    Thread-safe journal of one output directory. With resume=True the existing journal is read
+    first and new records are appended to it; otherwise it is started afresh.
+    Records:
+        {"type": "run", "input", "audio", "subs", "t"}                       (one per run)
+        {"type": "file", "src", "state", "stamp": [size, mtime_ns], "t", ...}
+    where identified records carry the identify "data" and done records the output "out_size".
+    """
+
+    def __init__(self, path: Path, resume: bool = False):
+        self.path = Path(path)
+        self.run = None
+        # src path -> latest state record / latest identified record of the previous runs
+        self._state = {}
+        self._ident = {}
+        if resume:
+            self._load()
+        self._lock = threading.Lock()
+        self._file = open(str(self.path), "a" if resume else "w", encoding="utf-8")
+
+    @classmethod
+    def open_in(cls, output_dir: Path, resume: bool = False) -> "JobJournal":
+        return cls(Path(output_dir) / JOURNAL_FILENAME, resume)
+
+    def _load(self):
+        try:
+            f = open(str(self.path), encoding="utf-8")
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # the last line may have been cut off by the crash
+                    continue
+                if not isinstance(rec, dict):
+                    continue
+                if rec.get("type") == "run":
+                    self.run = rec
+                elif rec.get("type") == "file" and "src" in rec:
+                    if rec.get("state") == IDENTIFIED:
+                        self._ident[rec["src"]] = rec
+                    else:
+                        self._state[rec["src"]] = rec
+
+    def _write(self, rec: dict):
+        rec["t"] = round(time.time(), 3)
+        line = json.dumps(rec, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line)
+            self._file.flush()
+
+    def start_run(self, input_desc: str, audio_langs: list, sub_langs: list):
+        self._write({"type": "run", "input": input_desc, "audio": audio_langs, "subs": sub_langs})
+
+    def record(self, src: Path, state: str, stamp=None, **fields):
+        rec = {"type": "file", "src": str(src), "state": state, "stamp": list(stamp) if stamp else None}
+        rec.update(fields)
+        self._write(rec)
+
+    def _done(self, src: Path, stamp) -> Optional[dict]:
+        # DONE record of a previous run for src, if the source is unchanged since
+        rec = self._state.get(str(src))
+        if rec is None or rec.get("state") != DONE or rec.get("stamp") != (list(stamp) if stamp else None):
+            return None
+        return rec
+
+    def finished(self, src: Path, stamp, out_path: Path) -> bool:
+        """
+        True if a previous run finished src, the source is unchanged since and the output it
+        wrote is still there with the recorded size.
+        """
+        rec = self._done(src, stamp)
+        if rec is None:
+            return False
+        out_size = rec.get("out_size")
+        if out_size is None:
+            # nothing was written for it (unchanged file in skip mode)
+            return True
+        try:
+            return out_path.stat().st_size == out_size
+        except OSError:
+            return False
+
+    def damaged(self, src: Path, stamp, out_path: Path) -> bool:
+        """
+        True if a previous run finished src (unchanged since) but the output it wrote has
+        been changed or truncated since, so it must be redone rather than skipped as existing.
+        """
+        rec = self._done(src, stamp)
+        if rec is None or rec.get("out_size") is None:
+            return False
+        try:
+            return out_path.stat().st_size != rec["out_size"]
+        except OSError:
+            # missing: skip-if-exists will not skip it anyway
+            return False
+
+    def identified(self, src: Path, stamp) -> Optional[dict]:
+        """Identify result recorded for src, if the file is unchanged since."""
+        rec = self._ident.get(str(src))
+        if rec is None or not stamp or rec.get("stamp") != list(stamp):
+            return None
+        return {"ok": True, "data": rec["data"], "stamp": tuple(stamp)}
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+remux_metrics.py
+Optional local HTTP endpoint for watching long batches from monitoring: serves
+RemuxEngine.status() of the running batch from a daemon thread, using only http.server.
+
+    GET /status    JSON: batch counters, ETA, bytes and throughput, running files, failures
+    GET /metrics   the same in Prometheus text format
+
+remux_last_progress_timestamp_seconds is the time any file last made progress, so a stalled
+batch shows up as time() - remux_last_progress_timestamp_seconds growing while files run.
+"""
+
+import json
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+DEFAULT_HOST = "127.0.0.1"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def parse_address(text: str):
+    """'PORT' or 'HOST:PORT' -> (host, port); a bare port binds to localhost only."""
+    host, sep, port = text.rpartition(":")
+    if not sep:
+        host = DEFAULT_HOST
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"invalid metrics address: {text!r} (expected PORT or HOST:PORT)")
+    if not 0 <= port <= 65535:
+        raise ValueError(f"invalid metrics port: {port}")
+    return host.strip("[]") or DEFAULT_HOST, port
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def _num(value) -> str:
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and not math.isfinite(value):
+        return "NaN" if math.isnan(value) else ("+Inf" if value > 0 else "-Inf")
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(status: dict, info: Optional[dict] = None) -> str:
+    """Prometheus text exposition of a status() dict (as served by MetricsServer)."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(**labels)} {_num(value)}")
+
+    batch = status.get("batch")
+    metric("remux_batch_active", "gauge", "1 while a batch is attached to the endpoint.", [({}, batch is not None)])
+    if info:
+        metric("remux_batch_info", "gauge", "Settings of the current batch.", [(info, 1)])
+    if batch is None:
+        return "\n".join(lines) + "\n"
+    metric("remux_files", "gauge", "Files in the current batch by state.",
+           [({"state": "ok"}, batch["ok"]), ({"state": "failed"}, batch["failed"]),
+            ({"state": "running"}, batch["running"]), ({"state": "queued"}, batch["queued"])])
+    metric("remux_batch_files", "gauge", "Files discovered in the current batch.", [({}, batch["total"])])
+    metric("remux_batch_finished", "gauge", "1 once every file of the batch is done.", [({}, batch["finished"])])
+    metric("remux_batch_progress_percent", "gauge", "Average progress over all files.", [({}, batch["pct"])])
+    metric("remux_batch_elapsed_seconds", "gauge", "Time since the batch started.", [({}, batch["elapsed"])])
+    metric("remux_batch_remaining_seconds", "gauge", "Estimated time left (NaN if unknown).",
+           [({}, batch["remaining"])])
+    metric("remux_bytes_processed", "gauge", "Source bytes remuxed or copied so far.", [({}, batch["bytes_done"])])
+    metric("remux_throughput_bytes_per_second", "gauge", "Source bytes processed per second of batch time.",
+           [({}, batch["bytes_per_sec"])])
+    metric("remux_last_progress_timestamp_seconds", "gauge", "Unix time any file last made progress.",
+           [({}, batch["last_progress"])])
+    running = status.get("running", [])
+    metric("remux_file_progress_percent", "gauge", "Progress of each file being remuxed.",
+           [({"no": r["no"], "file": r["name"]}, r["pct"]) for r in running])
+    metric("remux_file_throughput_bytes_per_second", "gauge", "Read rate of each file being remuxed.",
+           [({"no": r["no"], "file": r["name"]}, r["bytes_per_sec"]) for r in running])
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "remux-metrics"
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/status"
+        if path not in ("/status", "/metrics"):
+            self.send_error(404)
+            return
+        status, info = self.server.metrics.current()
+        if path == "/metrics":
+            body = render_prometheus(status, info).encode("utf-8")
+            content_type = PROMETHEUS_CONTENT_TYPE
+        else:
+            body = json.dumps(dict(status, info=info), default=str).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would drown the frontends' own output
+        pass
+
+
+class MetricsServer:
+    """
+    Serves the status of the engine last passed to attach() until close(). The socket is bound
+    on construction (an OSError if the address is in use); requests are handled on daemon
+    threads, so a hung client cannot keep the process alive.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = 0):
+        self._engine = None
+        self._info = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.metrics = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def attach(self, engine, **info):
+        """Report engine from now on; info (e.g. batch number, input dir) is passed along as is."""
+        with self._lock:
+            self._engine = engine
+            self._info = info
+
+    def current(self):
+        with self._lock:
+            engine, info = self._engine, self._info
+        status = engine.status() if engine is not None else {"batch": None, "running": [], "failed": []}
+        return status, info
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
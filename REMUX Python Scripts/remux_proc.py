@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+remux_proc.py
+Asyncio supervisor for the mkvmerge processes a batch starts.
+One event loop in a background thread spawns every identify and remux process with
+asyncio.create_subprocess_exec and reads their output without blocking, so many concurrent
+processes cost no reader thread or polling loop each. Worker threads call run(), which blocks
+only that caller until the process exits; line and idle callbacks run on the loop thread and
+must be quick. Processes are killed on timeout, on cancel_all() and on close().
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, List, NamedTuple, Optional
+
+# StreamReader buffer limit; longer lines are returned in pieces
+LINE_LIMIT = 1 << 20
+
+
+class ProcResult(NamedTuple):
+    returncode: Optional[int]
+    # captured stdout (stderr merged in unless merge_stderr=False), or its last keep_lines lines
+    output: str
+    stderr: str
+    timed_out: bool
+    # seconds spent starting the process, and from then until it exited
+    spawn_seconds: float = 0.0
+    run_seconds: float = 0.0
+
+
+def _use_pidfd_watcher(loop):
+    # Python 3.8-3.11 default to a watcher with one waitpid thread per child process; Linux
+    # pidfds let the loop itself wait for exits (3.12+ picks this automatically)
+    if sys.version_info >= (3, 12) or not hasattr(asyncio, "PidfdChildWatcher"):
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+        watcher = asyncio.PidfdChildWatcher()
+        watcher.attach_loop(loop)
+        asyncio.set_child_watcher(watcher)
+    except (AttributeError, OSError):
+        pass
+
+
+class ProcessSupervisor:
+    """Runs subprocesses on a private event loop; safe to call from any number of threads."""
+
+    def __init__(self):
+        if sys.platform == "win32":
+            # subprocess support on Windows needs the proactor loop (only the default from 3.8)
+            self._loop = asyncio.ProactorEventLoop()
+        else:
+            self._loop = asyncio.new_event_loop()
+            _use_pidfd_watcher(self._loop)
+        self._procs = set()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="remux-proc", daemon=True)
+        self._thread.start()
+
+    def run(self, cmd: List[str], on_line: Optional[Callable[[str], None]] = None,
+            on_idle: Optional[Callable[[], None]] = None, idle_interval: float = 0.25,
+            timeout: Optional[float] = None, merge_stderr: bool = True,
+            keep_lines: Optional[int] = None) -> ProcResult:
+        """
+        Run cmd to completion and return its result. on_line gets each output line as it
+        arrives; on_idle is called every idle_interval seconds without output. Raises OSError
+        if the program cannot be started.
+        """
+        coro = self._run(cmd, on_line, on_idle, idle_interval, timeout, merge_stderr, keep_lines)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _run(self, cmd, on_line, on_idle, idle_interval, timeout, merge_stderr, keep_lines):
+        t0 = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT if merge_stderr else asyncio.subprocess.PIPE,
+            limit=LINE_LIMIT)
+        spawned = time.monotonic()
+        self._procs.add(proc)
+        lines = deque(maxlen=keep_lines)
+        err_task = None if merge_stderr else asyncio.ensure_future(proc.stderr.read())
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        timed_out = False
+        try:
+            while True:
+                wait = idle_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        timed_out = True
+                        break
+                try:
+                    raw = await asyncio.wait_for(proc.stdout.readline(), wait)
+                except asyncio.TimeoutError:
+                    if on_idle is not None:
+                        on_idle()
+                    continue
+                except ValueError:
+                    # line longer than LINE_LIMIT: take what is buffered
+                    raw = await proc.stdout.read(LINE_LIMIT)
+                if not raw:
+                    break
+                line = raw.decode("utf-8", errors="replace")
+                lines.append(line)
+                if on_line is not None:
+                    on_line(line)
+            if timed_out:
+                proc.kill()
+            returncode = await proc.wait()
+            stderr = (await err_task).decode("utf-8", errors="replace") if err_task is not None else ""
+        except BaseException:
+            # cancelled, or an on_line/on_idle callback raised: never leave the process running
+            # with nothing reading its output
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        finally:
+            self._procs.discard(proc)
+            if err_task is not None and not err_task.done():
+                err_task.cancel()
+        return ProcResult(None if timed_out else returncode, "".join(lines), stderr, timed_out,
+                          spawned - t0, time.monotonic() - spawned)
+
+    def cancel_all(self):
+        """Kill every running process; their run() calls return with a non-zero returncode."""
+        def _kill():
+            for proc in list(self._procs):
+                if proc.returncode is None:
+                    proc.kill()
+        self._loop.call_soon_threadsafe(_kill)
+
+    def close(self):
+        self.cancel_all()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def supervisor() -> ProcessSupervisor:
+    """The process supervisor shared by everything in this process, started on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ProcessSupervisor()
+        return _default
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+remux_sched.py
+Device-aware job scheduler: decides which queued remux a free worker runs next.
+Each remux reads from one disk and writes to another (or the same one). Jobs are grouped by
+their (source, destination) st_dev pair and free workers take the next job round-robin across
+groups, so a batch spread over several disks keeps all of them busy. With a per_device limit,
+at most that many jobs touch any one device at a time, so no single spindle is thrashed.
+Within and across groups, jobs start in priority order (see ORDER_POLICIES).
+"""
+
+import heapq
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Optional, Tuple
+
+# default number of concurrent jobs per device; 0 means no per-device limit, so --jobs alone sets
+# the concurrency (source and output usually share one SSD, where a per-disk cap only slows it down)
+DEFAULT_DEVICE_JOBS = 0
+
+# job start order: name keeps submission (file name) order; largest starts the biggest files first,
+# which minimises the batch makespan with parallel jobs; smallest gives the most finished files early
+ORDER_POLICIES = ("name", "largest", "smallest")
+
+
+def job_priority(src: Path, policy: str) -> int:
+    """Sort key for DeviceScheduler.submit(); lower starts first."""
+    if policy == "name":
+        return 0
+    try:
+        size = os.stat(str(src)).st_size
+    except OSError:
+        size = 0
+    return -size if policy == "largest" else size
+
+
+def device_of(path: Path) -> Optional[int]:
+    """st_dev of path, or of its nearest existing parent for outputs that do not exist yet."""
+    p = Path(os.path.abspath(str(path)))
+    while True:
+        try:
+            return os.stat(str(p)).st_dev
+        except OSError:
+            if p.parent == p:
+                return None
+            p = p.parent
+
+
+def job_devices(src: Path, dst: Path) -> Tuple[int, ...]:
+    """Devices a remux of src into dst keeps busy (one entry when both are on the same device)."""
+    devs = []
+    for dev in (device_of(src), device_of(dst)):
+        if dev is not None and dev not in devs:
+            devs.append(dev)
+    return tuple(devs)
+
+
+class DeviceScheduler:
+    """
+    Worker pool with per-device concurrency limits. submit() takes the devices a job uses
+    (see job_devices) and returns a concurrent.futures.Future, so callers can wait with
+    as_completed() as with a ThreadPoolExecutor. A free worker starts the queued job with the
+    lowest priority value among the groups with free slots; equal priorities go round-robin across
+    groups and in submission order within a group. Use as a context manager; leaving it
+    waits for all submitted jobs.
+    """
+
+    def __init__(self, jobs: int, per_device: int = DEFAULT_DEVICE_JOBS):
+        self.jobs = max(1, jobs)
+        self.per_device = per_device if per_device > 0 else self.jobs
+        # device group -> heap of queued (priority, seq, future, fn, args, kwargs);
+        # iteration order is the round-robin order
+        self._groups = OrderedDict()
+        self._seq = itertools.count()
+        self._busy = {}
+        self._closed = False
+        self._cond = threading.Condition()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.jobs)]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, devices: Tuple[int, ...], fn, *args, priority: int = 0, **kwargs) -> Future:
+        fut = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("cannot submit to a scheduler that has been shut down")
+            heapq.heappush(self._groups.setdefault(tuple(devices), []),
+                           (priority, next(self._seq), fut, fn, args, kwargs))
+            self._cond.notify()
+        return fut
+
+    def _next_job(self):
+        # best head among the groups whose devices all have a free slot; the first such group in
+        # round-robin order wins ties
+        best = None
+        for group, queued in self._groups.items():
+            if all(self._busy.get(dev, 0) < self.per_device for dev in group):
+                if best is None or queued[0][0] < self._groups[best][0][0]:
+                    best = group
+        if best is None:
+            return None
+        queued = self._groups[best]
+        job = heapq.heappop(queued)[2:]
+        if queued:
+            self._groups.move_to_end(best)
+        else:
+            del self._groups[best]
+        for dev in best:
+            self._busy[dev] = self._busy.get(dev, 0) + 1
+        return best, job
+
+    def _work(self):
+        while True:
+            with self._cond:
+                picked = self._next_job()
+                while picked is None:
+                    if self._closed and not self._groups:
+                        return
+                    self._cond.wait()
+                    picked = self._next_job()
+            group, (fut, fn, args, kwargs) = picked
+            if fut.set_running_or_notify_cancel():
+                try:
+                    fut.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    fut.set_exception(e)
+            with self._cond:
+                for dev in group:
+                    self._busy[dev] -= 1
+                # freed slots may unblock jobs another worker skipped
+                self._cond.notify_all()
+
+    def cancel_pending(self):
+        """Cancel every job that has not started and refuse new ones; running jobs continue."""
+        with self._cond:
+            self._closed = True
+            for queued in self._groups.values():
+                for job in queued:
+                    job[2].cancel()
+            self._groups.clear()
+            self._cond.notify_all()
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._workers:
+                t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
+        return False
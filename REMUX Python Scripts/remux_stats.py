@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+remux_stats.py
+Incremental batch progress aggregates: counts, average progress, throughput and ETA.
+Workers report per-file transitions (start, progress, finish); reading the batch
+state then costs O(running files + devices) instead of a pass over every row.
+Remaining time is bytes left divided by the throughput measured per source device,
+which ThroughputModel keeps between runs so a new batch starts with a realistic ETA.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Hashable, Optional
+
+from remux_cache import default_cache_dir
+
+THROUGHPUT_FILENAME = "throughput.json"
+# files finished faster than this say little about throughput (skips, reflinks, tiny files)
+MIN_SAMPLE_SECONDS = 1.0
+# weight of a new sample in the per-device moving average
+SAMPLE_WEIGHT = 0.3
+# a running file's own rate is fully trusted once it is this far along
+OWN_RATE_PCT = 25
+
+
+class ThroughputModel:
+    """
+    Bytes per second per source device (st_dev), as an exponential moving average of
+    finished files, plus an all-devices average for devices not seen yet. Thread-safe.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path is not None else None
+        self._rates = {}
+        self._lock = threading.Lock()
+        if self.path is not None:
+            try:
+                with open(str(self.path), encoding="utf-8") as f:
+                    data = json.load(f)
+                self._rates = {str(k): float(v) for k, v in data.get("rates", {}).items() if float(v) > 0}
+            except (OSError, ValueError, AttributeError, TypeError):
+                self._rates = {}
+
+    @classmethod
+    def open_default(cls) -> "ThroughputModel":
+        return cls(default_cache_dir() / THROUGHPUT_FILENAME)
+
+    def rate(self, device: Optional[int]) -> Optional[float]:
+        """Expected bytes/s for a file on device, or None before anything was measured."""
+        with self._lock:
+            if device is not None and str(device) in self._rates:
+                return self._rates[str(device)]
+            return self._rates.get("*")
+
+    def record(self, device: Optional[int], size: int, seconds: float):
+        if size <= 0 or seconds < MIN_SAMPLE_SECONDS:
+            return
+        sample = size / seconds
+        with self._lock:
+            keys = ["*"] if device is None else [str(device), "*"]
+            for k in keys:
+                old = self._rates.get(k)
+                self._rates[k] = sample if old is None else old + SAMPLE_WEIGHT * (sample - old)
+
+    def save(self):
+        """Write the rates back; failures are ignored since the model is only an estimate."""
+        if self.path is None:
+            return
+        with self._lock:
+            data = {"rates": dict(self._rates)}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(str(tmp), "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(str(tmp), str(self.path))
+        except OSError:
+            pass
+
+
+def file_remaining(size: Optional[int], pct: int, elapsed: float, rate: Optional[float]) -> Optional[float]:
+    """
+    Seconds left for one file: bytes left over a rate that starts at the device rate and
+    moves to the file's own measured rate as it progresses. Without a size, extrapolates pct.
+    """
+    if not size:
+        return elapsed * (100 - pct) / pct if pct > 0 else None
+    own = size * pct / 100 / elapsed if pct > 0 and elapsed > 0 else None
+    if own is not None and rate is not None:
+        w = min(1.0, pct / OWN_RATE_PCT)
+        rate = w * own + (1 - w) * rate
+    elif own is not None:
+        rate = own
+    if not rate:
+        return None
+    return size * (100 - pct) / 100 / rate
+
+
+class BatchStats:
+    """
+    Thread-safe running totals for one batch. Files are identified by any hashable key.
+    With growing=True files are still being discovered: add() raises the total and the batch
+    only counts as finished after close(). Files registered with their size and source device
+    get byte-based estimates from `throughput`; others fall back to the average file time.
+    """
+
+    def __init__(self, total: int, jobs: int = 1, start_time: Optional[float] = None, growing: bool = False,
+                 throughput: Optional[ThroughputModel] = None):
+        self.total = total
+        self.jobs = jobs
+        self.growing = growing
+        self.start_time = start_time if start_time is not None else time.time()
+        self.started = 0
+        self.done = 0
+        self.ok = 0
+        self.failed = 0
+        self.pct_sum = 0
+        self.completed_time = 0.0
+        self.completed_count = 0
+        # source bytes remuxed or copied by finished files, and when any file last made progress
+        self.bytes_done = 0
+        self.last_progress = self.start_time
+        # key -> (pct, elapsed) for files currently being processed
+        self.active = {}
+        self._pct = {}
+        self._finished = set()
+        self.throughput = throughput
+        # key -> (size, device) for registered files
+        self._files = {}
+        # device -> [file count, bytes] of registered files not started yet
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, count: int = 1):
+        """Register newly discovered files."""
+        with self._lock:
+            self.total += count
+
+    def close(self):
+        """No more files will be added."""
+        with self._lock:
+            self.growing = False
+
+    def register(self, key: Hashable, size: Optional[int], device: Optional[int] = None):
+        """Record a queued file's size and source device for byte-based estimates."""
+        with self._lock:
+            if key in self._files or not size:
+                return
+            self._files[key] = (size, device)
+            if key not in self._pct:
+                pending = self._pending.setdefault(device, [0, 0])
+                pending[0] += 1
+                pending[1] += size
+
+    def register_path(self, key: Hashable, path: Path):
+        """register() with the size and device taken from a stat of path."""
+        try:
+            st = os.stat(str(path))
+        except OSError:
+            return
+        self.register(key, st.st_size, st.st_dev)
+
+    def file_size(self, key: Hashable) -> Optional[int]:
+        """Registered size of a file (None if unknown)."""
+        with self._lock:
+            return self._files.get(key, (None, None))[0]
+
+    def _rate(self, device: Optional[int]) -> Optional[float]:
+        return self.throughput.rate(device) if self.throughput is not None else None
+
+    def _file_remaining(self, key: Hashable, pct: int, elapsed: float) -> Optional[float]:
+        size, device = self._files.get(key, (None, None))
+        return file_remaining(size, pct, elapsed, self._rate(device))
+
+    def _ensure_started(self, key: Hashable):
+        if key not in self._pct:
+            self._pct[key] = 0
+            self.started += 1
+            self.active[key] = (0, 0.0)
+            if key in self._files:
+                size, device = self._files[key]
+                pending = self._pending[device]
+                pending[0] -= 1
+                pending[1] -= size
+                if not pending[0]:
+                    del self._pending[device]
+
+    def start(self, key: Hashable):
+        """Mark a file as picked up by a worker. Repeated calls are ignored."""
+        with self._lock:
+            self._ensure_started(key)
+
+    def progress(self, key: Hashable, pct: int, elapsed: Optional[float] = None) -> Optional[float]:
+        """Record a file's progress; returns its estimated remaining seconds (None if unknown)."""
+        with self._lock:
+            self._ensure_started(key)
+            self.pct_sum += pct - self._pct[key]
+            self._pct[key] = pct
+            if key in self.active:
+                self.active[key] = (pct, elapsed or 0.0)
+            self.last_progress = time.time()
+            return self._file_remaining(key, pct, elapsed or 0.0)
+
+    def finish(self, key: Hashable, success: bool, pct: Optional[int] = None, duration: Optional[float] = None,
+               nbytes: int = 0):
+        """
+        Record a finished file. `duration` feeds the per-file average and the device
+        throughput used for the ETA; pass None for files whose time says nothing about the
+        rest of the batch (failures). `nbytes` is how much of the source was actually remuxed
+        or copied (0 for skipped, linked and dry-run files) and is added to bytes_done.
+        """
+        with self._lock:
+            if key in self._finished:
+                return
+            self._ensure_started(key)
+            if pct is not None:
+                self.pct_sum += pct - self._pct[key]
+                self._pct[key] = pct
+            self.active.pop(key, None)
+            self._finished.add(key)
+            self.done += 1
+            self.bytes_done += nbytes
+            self.last_progress = time.time()
+            if success:
+                self.ok += 1
+            else:
+                self.failed += 1
+            if duration is not None:
+                self.completed_time += duration
+                self.completed_count += 1
+                if self.throughput is not None and key in self._files:
+                    size, device = self._files[key]
+                    self.throughput.record(device, size, duration)
+
+    def snapshot(self) -> dict:
+        """
+        Batch progress: pct, elapsed, remaining (ETA seconds or None), counters, finished flag,
+        source bytes processed so far and the time.time() of the last file progress.
+        """
+        with self._lock:
+            total = self.total
+            queued = total - self.started
+            active = [(pct, self._file_remaining(key, pct, elapsed)) for key, (pct, elapsed) in self.active.items()]
+            # finished bytes plus the share of running files already processed
+            bytes_done = self.bytes_done + sum(self._files.get(key, (0, None))[0] * pct // 100
+                                               for key, (pct, _) in self.active.items())
+            last_progress = self.last_progress
+            # queued bytes per device that has a known rate; the rest are counted by file
+            queued_work = 0.0
+            queued_unknown = queued
+            for device, (count, nbytes) in self._pending.items():
+                rate = self._rate(device)
+                if rate:
+                    queued_work += nbytes / rate
+                    queued_unknown -= count
+            avg_pct = int(self.pct_sum / total) if total > 0 else 0
+            completed_time = self.completed_time
+            completed_count = self.completed_count
+            done, ok, failed = self.done, self.ok, self.failed
+            growing = self.growing
+        # per-file estimates for files currently being processed (byte-based where possible)
+        running_remaining = [est for _, est in active]
+        # per-file time for files without an estimate: avg of completed times if available,
+        # else projected time of running files
+        avg_time = None
+        if completed_count > 0:
+            avg_time = completed_time / completed_count
+        else:
+            projected = [self._projected_total(pct, est) for pct, est in active]
+            projected = [t for t in projected if t is not None]
+            if projected:
+                avg_time = sum(projected) / len(projected)
+        # estimate remaining: outstanding work spread over the worker lanes, but never less than
+        # the longest file still running
+        remaining = None
+        if avg_time is not None or (None not in running_remaining and not queued_unknown):
+            estimates = [avg_time if x is None else x for x in running_remaining]
+            work = sum(estimates) + queued_work + queued_unknown * (avg_time or 0.0)
+            lanes = max(1, min(self.jobs, len(estimates) + queued))
+            remaining = max(max(estimates, default=0.0), work / lanes)
+        return {
+            "pct": avg_pct,
+            "elapsed": time.time() - self.start_time,
+            "remaining": remaining,
+            "done": done,
+            "total": total,
+            "finished": not growing and done >= total,
+            "ok": ok,
+            "failed": failed,
+            "running": len(active),
+            "queued": queued,
+            "bytes_done": bytes_done,
+            "last_progress": last_progress,
+        }
+
+    @staticmethod
+    def _projected_total(pct: int, remaining: Optional[float]) -> Optional[float]:
+        # whole-file time implied by a running file's remaining time and progress
+        if remaining is None or pct <= 0 or pct >= 100:
+            return None
+        return remaining * 100 / (100 - pct)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+remux_trace.py
+Structured timing trace of a batch, for profiling: one JSON object per line, written and
+flushed as each event happens so a trace of a run that is still going (or crashed) can be
+read as is. RemuxEngine writes:
+
+    {"event": "run_start", "options": {...}}
+    {"event": "phase", "key", "src", "phase", "seconds", ...}    as each phase of a file ends
+    {"event": "job", "key", "src", "out", "ok", "status", "reason", "rc", "warnings", "errors",
+     "bytes_read", "bytes_written", "read_mbps", "seconds", "phases": {phase: seconds}}
+    {"event": "run_end", "batch": stats snapshot}
+
+Phases of a file, in order: identify (with "via": scan, journal, header, cache or mkvmerge),
+queue_wait (scheduled until a worker started it), spawn (starting mkvmerge), mux (mkvmerge
+running, with rc, warnings and errors), finalize (checking and renaming the output), or
+place (copying/linking an unchanged file) instead of spawn, mux and finalize.
+Every event also has "t", the wall-clock time it was written.
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+
+
+class TraceWriter:
+    """Thread-safe, append-only JSONL event stream."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(str(self.path), "a", encoding="utf-8")
+
+    def emit(self, event: str, **fields):
+        rec = {"event": event, "t": round(time.time(), 3)}
+        rec.update(fields)
+        line = json.dumps(rec, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
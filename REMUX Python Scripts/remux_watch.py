@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+remux_watch.py
+Watch-folder support for the headless runner: yields .mkv files as they arrive in an input
+tree, once they are completely written. On Linux the kernel's inotify API (through ctypes, no
+extra packages) reports closed and moved-in files as they happen; elsewhere, or when inotify is
+unavailable, directories are listed every poll interval. Either way a file counts as written
+when its writer closed it, it was moved into place, or its size and mtime stopped changing for
+`settle` seconds. Files are never identified or opened here, only stat()ed.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from remux_fileops import iter_mkv_files, matches_exclude
+
+# a file is taken as complete once its size and mtime have not changed for this long
+SETTLE_SECONDS = 5.0
+# how often directories are listed without inotify, and candidates re-checked with it
+POLL_INTERVAL = 2.0
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT = struct.Struct("iIII")
+
+
+def _stamp(path: Path):
+    try:
+        st = os.stat(str(path))
+        return (st.st_size, st.st_mtime_ns)
+    except OSError:
+        return None
+
+
+class _Inotify:
+    """Minimal inotify binding: add_watch() and read() of (wd, mask, name) events."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._add(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read(self, timeout: float):
+        """Events that arrive within timeout seconds (an empty list if none)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 1 << 16)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, pos)
+            pos += _EVENT.size
+            name = os.fsdecode(buf[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Yields each .mkv file under root once it is completely written, and again if it is later
+    replaced by a different file (callers should then overwrite its output, as REMUX_Batch does
+    with RemuxEngine.add(overwrite=True)). Files present at start are yielded too, so a restarted
+    watcher picks up what arrived while it was down (the engine's skip-if-exists and journal skip
+    the ones already done). The subfolder, exclude, symlink and skip_dirs options mean the same as
+    for remux_fileops.iter_mkv_files; backend is "auto", "inotify" (an OSError if unavailable) or
+    "polling".
+    """
+
+    def __init__(self, root: Path, recursive: bool = False, exclude=(), follow_symlinks: bool = False,
+                 skip_dirs=(), settle: float = SETTLE_SECONDS, poll_interval: float = POLL_INTERVAL,
+                 backend: str = "auto"):
+        self.root = Path(root)
+        self.recursive = recursive
+        self.exclude = tuple(exclude)
+        self.follow_symlinks = follow_symlinks
+        self.skip_dirs = {os.path.realpath(str(d)) for d in skip_dirs}
+        self.settle = settle
+        self.poll_interval = poll_interval
+        # path -> (stamp, time the stamp was last seen to change, complete by an event)
+        self._candidates = {}
+        # path -> stamp it was yielded with
+        self._yielded = {}
+        self._inotify = None
+        # wd -> watched directory path / its (st_dev, st_ino), so each real directory is watched once
+        self._dirs = {}
+        self._dir_ids = {}
+        self._watched_ids = set()
+        if backend in ("auto", "inotify") and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                if backend == "inotify":
+                    raise
+        elif backend == "inotify":
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self._inotify is not None else "polling"
+
+    def _is_excluded(self, path: str) -> bool:
+        # path or any folder above it (below root) matches an exclude pattern
+        parts = Path(path).relative_to(self.root).parts
+        return any(matches_exclude(parts[i], "/".join(parts[:i + 1]), self.exclude) for i in range(len(parts)))
+
+    def _wanted_dir(self, path: str) -> bool:
+        if os.path.realpath(path) in self.skip_dirs or self._is_excluded(path):
+            return False
+        return path == str(self.root) or self.follow_symlinks or not os.path.islink(path)
+
+    def _wanted_file(self, path: str) -> bool:
+        return os.path.basename(path).lower().endswith(".mkv") and not self._is_excluded(path)
+
+    def _watch_tree(self, top: str):
+        # watch top and, when recursive, every wanted directory below it
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            if not self._wanted_dir(path):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            dir_id = (st.st_dev, st.st_ino)
+            if dir_id in self._watched_ids:
+                # already watched through another path (a symlink loop ends here)
+                continue
+            try:
+                wd = self._inotify.add_watch(path, _WATCH_MASK)
+            except OSError as e:
+                if e.errno in (errno.ENOSPC, errno.ENOMEM):
+                    # out of watches: fall back to listing directories
+                    self._stop_inotify()
+                    return
+                continue
+            self._dirs[wd] = path
+            self._dir_ids[wd] = dir_id
+            self._watched_ids.add(dir_id)
+            if self.recursive:
+                try:
+                    with os.scandir(path) as it:
+                        stack.extend(e.path for e in it if e.is_dir(follow_symlinks=self.follow_symlinks))
+                except OSError:
+                    pass
+
+    def _stop_inotify(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+            self._dirs.clear()
+            self._dir_ids.clear()
+            self._watched_ids.clear()
+
+    def _scan(self, top: Path):
+        """Make every .mkv file below top a candidate (used at start, on new folders and when polling)."""
+        if not self._wanted_dir(str(top)):
+            return
+        # patterns are relative to root, so only a scan from root can prune excluded folders itself
+        exclude = self.exclude if top == self.root else ()
+        for f in iter_mkv_files(top, self.recursive, exclude, self.follow_symlinks, self.skip_dirs):
+            if self._wanted_file(str(f)):
+                self._candidate(str(f))
+
+    def _candidate(self, path: str, complete: bool = False):
+        stamp = _stamp(Path(path))
+        if stamp is None or self._yielded.get(path) == stamp:
+            return
+        old = self._candidates.get(path)
+        if old is None or old[0] != stamp:
+            self._candidates[path] = (stamp, time.monotonic(), complete)
+        elif complete:
+            self._candidates[path] = (stamp, old[1], True)
+
+    def _handle(self, events):
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped: look at the whole tree again
+                self._scan(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                self._watched_ids.discard(self._dir_ids.pop(wd, None))
+                continue
+            parent = self._dirs.get(wd)
+            if parent is None or not name:
+                continue
+            path = os.path.join(parent, name)
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # watch the new folder first, then list it for files that arrived before the watch
+                    self._watch_tree(path)
+                    self._scan(Path(path))
+            elif self._wanted_file(path):
+                self._candidate(path, complete=bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)))
+
+    def _ready(self):
+        now = time.monotonic()
+        for path, (stamp, since, complete) in list(self._candidates.items()):
+            current = _stamp(Path(path))
+            if current is None:
+                del self._candidates[path]
+            elif current != stamp:
+                # still being written
+                self._candidates[path] = (current, now, False)
+            elif complete or now - since >= self.settle:
+                del self._candidates[path]
+                self._yielded[path] = stamp
+                yield Path(path)
+
+    def watch(self, stop: Optional[threading.Event] = None) -> Iterator[Path]:
+        """Yield completed files until stop is set (or forever)."""
+        stop = stop or threading.Event()
+        if self._inotify is not None:
+            self._watch_tree(str(self.root))
+        self._scan(self.root)
+        try:
+            while not stop.is_set():
+                yield from self._ready()
+                if self._inotify is not None:
+                    # returns as soon as something arrives; the timeout bounds how late stop is noticed
+                    self._handle(self._inotify.read(min(self.poll_interval, 1.0)))
+                else:
+                    stop.wait(self.poll_interval)
+                    self._scan(self.root)
+        finally:
+            self._stop_inotify()